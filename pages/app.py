@@ -1,35 +1,673 @@
-from flask import Flask, request, render_template, redirect, session, abort
-import psycopg2
-from psycopg2 import sql
+from flask import Flask, request, render_template, redirect, session, abort, g, Response
+from psycopg2 import sql, errors
 from flask import jsonify
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_values
 import secrets
 import json
 from geopy.distance import distance
 from functools import wraps
 import hashlib
+import os
+import routing
+import geometry
+import map_tiles
+from route_cache import RouteCache
+from route_table import RouteTable
+from route_executor import RouteExecutor
+from concurrent.futures import TimeoutError as RouteTimeout
+from db import ConnectionPool, DB_SETTINGS
+from psycopg2.pool import PoolError
+import closures
+import closure_schedule
+import graph_changes
+from events import EventBroadcaster
+from report_queue import ReportQueue
+import atexit
+import threading
+import time
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(32)
 
+# "sql" routes with pgr_dijkstra/pgr_ksp in postgres, "memory" uses the in-process graph in routing.py
+app.config["ROUTING_ENGINE"] = os.environ.get("ROUTING_ENGINE", "sql")
+app.config["ROUTE_CACHE_SIZE"] = int(os.environ.get("ROUTE_CACHE_SIZE", 256))
+app.config["SAVED_ROUTE_SETS"] = int(os.environ.get("SAVED_ROUTE_SETS", 4096))
+# route computations run at most ROUTE_WORKERS at a time, a request gives up after ROUTE_WAIT_TIMEOUT seconds
+app.config["ROUTE_WORKERS"] = int(os.environ.get("ROUTE_WORKERS", 4))
+app.config["ROUTE_WAIT_TIMEOUT"] = float(os.environ.get("ROUTE_WAIT_TIMEOUT", 30))
+# how the memory engine finds alternatives: "penalty" stops once it has ROUTE_COUNT different
+# enough routes, "ksp" ranks 10 k-shortest paths and drops the overlapping ones. the sql engine
+# always uses pgr_ksp
+app.config["ROUTE_ALTERNATIVES"] = os.environ.get("ROUTE_ALTERNATIVES", "penalty")
+# routes offered per trip, and the largest share of an alternative's edges that may be on the shortest route
+app.config["ROUTE_COUNT"] = int(os.environ.get("ROUTE_COUNT", 3))
+app.config["ROUTE_MAX_OVERLAP"] = float(os.environ.get("ROUTE_MAX_OVERLAP", 0.6))
+# connections kept open to postgres, and how long a request waits for one before failing
+app.config["DB_POOL_MIN"] = int(os.environ.get("DB_POOL_MIN", 2))
+app.config["DB_POOL_MAX"] = int(os.environ.get("DB_POOL_MAX", 20))
+app.config["DB_POOL_TIMEOUT"] = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+# "move" copies closed rows into removed_nodes/removed_edges, "flag" sets closed_mask bits on the
+# schema from sql/soft_closures.sql so a closure is a single-row update
+app.config["CLOSURE_MODE"] = os.environ.get("CLOSURE_MODE", "move")
+# compare route lengths against geopy and log any difference above the tolerance in meters
+app.config["CHECK_ROUTE_LENGTHS"] = os.environ.get("CHECK_ROUTE_LENGTHS") == "1"
+app.config["ROUTE_LENGTH_TOLERANCE"] = float(os.environ.get("ROUTE_LENGTH_TOLERANCE", 0.5))
+# "geojson" sends per-edge GeoJSON and per-node direction dicts, "compact" sends encoded
+# polylines per route and columnar direction attributes
+app.config["ROUTE_PAYLOAD"] = os.environ.get("ROUTE_PAYLOAD", "geojson")
+# zoom level route lines are simplified for, detail under half a pixel is dropped (0 keeps every point)
+app.config["ROUTE_SIMPLIFY_ZOOM"] = int(os.environ.get("ROUTE_SIMPLIFY_ZOOM", 20))
+# precompute every building pair in the background and serve /map from that table
+app.config["PRECOMPUTE_ROUTES"] = os.environ.get("PRECOMPUTE_ROUTES") == "1"
+app.config["ROUTE_TABLE_PATH"] = os.environ.get(
+    "ROUTE_TABLE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "route_table.json")
+)
+# ALT landmarks built for the in-process graph when it loads, A* on them instead of plain dijkstra (0 turns them off)
+app.config["ROUTING_LANDMARKS"] = int(os.environ.get("ROUTING_LANDMARKS", 0))
+# memory-mapped copies of the in-process graph's arrays, so workers start without loading the graph
+# from postgres, rebuilt when the tables change ("" turns them off)
+app.config["GRAPH_SNAPSHOT_DIR"] = os.environ.get(
+    "GRAPH_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "graph_snapshots")
+)
+# building points for the map's building layer, {name: [lat, lng]}
+app.config["BUILDINGS_PATH"] = os.environ.get(
+    "BUILDINGS_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "umbc_buildings.json")
+)
+app.config["MAP_TILE_CACHE_SIZE"] = int(os.environ.get("MAP_TILE_CACHE_SIZE", 1024))
+# how far from the nearest open node a position may be for /reroute or "My Location" to start there
+app.config["REROUTE_MAX_SNAP_M"] = float(os.environ.get("REROUTE_MAX_SNAP_M", 200))
+# reports wait in memory and are written in batches; a user reporting the same node again within
+# REPORT_DEDUPE_SECONDS is ignored, and past REPORT_QUEUE_MAX waiting reports new ones get a 503
+app.config["REPORT_QUEUE_MAX"] = int(os.environ.get("REPORT_QUEUE_MAX", 1000))
+app.config["REPORT_BATCH_SIZE"] = int(os.environ.get("REPORT_BATCH_SIZE", 200))
+app.config["REPORT_FLUSH_SECONDS"] = float(os.environ.get("REPORT_FLUSH_SECONDS", 1.0))
+app.config["REPORT_DEDUPE_SECONDS"] = float(os.environ.get("REPORT_DEDUPE_SECONDS", 600))
+# reports per page when an admin opens a node in the report summary
+app.config["REPORTS_PAGE_SIZE"] = int(os.environ.get("REPORTS_PAGE_SIZE", 20))
+# page size of /alerts, and seconds between keepalive comments on /events streams
+app.config["ALERTS_PAGE_SIZE"] = int(os.environ.get("ALERTS_PAGE_SIZE", 50))
+app.config["EVENTS_KEEPALIVE"] = float(os.environ.get("EVENTS_KEEPALIVE", 15))
+# changes made by other worker processes are applied before every request, and also polled for
+# every GRAPH_SYNC_INTERVAL seconds so idle workers keep their /events streams current (0 turns polling off)
+app.config["GRAPH_SYNC_INTERVAL"] = float(os.environ.get("GRAPH_SYNC_INTERVAL", 2))
+
+
+db_pool = ConnectionPool(
+    app.config["DB_POOL_MIN"],
+    app.config["DB_POOL_MAX"],
+    timeout=app.config["DB_POOL_TIMEOUT"],
+    **DB_SETTINGS
+)
 
-map_conn = psycopg2.connect(
-    host="localhost",
-    dbname="map_db",
-    user="postgres",
-    password="thebestpassword",
-    port="5432"
+# startLocation value for routing from the user's gps position, and the name shown for it
+MY_LOCATION = "__my_location__"
+MY_LOCATION_LABEL = "My Location"
+
+routing.set_snapshot_dir(app.config["GRAPH_SNAPSHOT_DIR"])
+routing.set_landmarks(app.config["ROUTING_LANDMARKS"])
+route_cache = RouteCache(app.config["ROUTE_CACHE_SIZE"])
+route_executor = RouteExecutor(app.config["ROUTE_WORKERS"])
+# route sets shown to users, kept across graph changes so an active navigation stays consistent
+saved_route_sets = RouteCache(app.config["SAVED_ROUTE_SETS"])
+route_table = None
+map_bootstrap = {}
+map_bootstrap_lock = threading.Lock()
+# tiled map layers: zoom range they are served at and how long browsers may keep a tile
+MAP_LAYERS = {
+    "network": {"min_zoom": 15, "max_zoom": 18, "cache_control": "private, no-cache"},
+    "buildings": {"min_zoom": 14, "max_zoom": 16, "cache_control": "private, max-age=86400"},
+    "reports": {"min_zoom": 0, "max_zoom": 16, "cache_control": "private, no-cache"}
+}
+map_layers = {}
+map_layers_lock = threading.Lock()
+map_tile_cache = RouteCache(app.config["MAP_TILE_CACHE_SIZE"])
+# alerts and closures pushed to open /events streams
+broadcaster = EventBroadcaster()
+# newest graph_changes version this process has applied, None when the log table is missing
+graph_sync = {"version": None}
+graph_sync_lock = threading.Lock()
+
+
+# one multi-row insert per batch, on a connection of its own so it never holds a request's
+def write_reports(rows):
+    conn = db_pool.getconn()
+    try:
+        cur = conn.cursor()
+        execute_values(cur, """
+            INSERT INTO reports (user_id, user_email, node_id, node_name, building, description)
+            VALUES %s
+        """, rows, page_size=len(rows))
+        cur.close()
+        conn.commit()
+    finally:
+        db_pool.putconn(conn)
+
+
+report_queue = ReportQueue(
+    write_reports,
+    max_pending=app.config["REPORT_QUEUE_MAX"],
+    batch_size=app.config["REPORT_BATCH_SIZE"],
+    flush_interval=app.config["REPORT_FLUSH_SECONDS"],
+    dedupe_window=app.config["REPORT_DEDUPE_SECONDS"]
 )
+# write whatever is still waiting when the server shuts down
+atexit.register(report_queue.flush)
+
+
+# connection for the current request, checked out of the pool on first use
+def get_conn():
+    if "db_conn" not in g:
+        g.db_conn = db_pool.getconn()
+    return g.db_conn
+
+
+# give the request's connection back early, e.g. before a long wait. anything uncommitted on it is
+# rolled back, and a later get_conn() checks out a fresh one
+def release_conn():
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        db_pool.putconn(conn)
+
+
+# give the request's connection back, rolling back whatever was left open
+@app.teardown_appcontext
+def return_conn(error):
+    release_conn()
 
 
 # get length of route in meters
 def compute_route_length_meters(geoms):
+    total = geometry.route_length_meters(geoms)
+    if app.config["CHECK_ROUTE_LENGTHS"]:
+        reference = geodesic_route_length_meters(geoms)
+        if abs(total - reference) > app.config["ROUTE_LENGTH_TOLERANCE"]:
+            print("Route length mismatch:", round(total, 3), "vs geopy", round(reference, 3))
+    return round(total)
+
+
+# slow per-segment geopy length, only used to check the vectorized one
+def geodesic_route_length_meters(geoms):
     total = 0
     for g in geoms:
         coords = json.loads(g["geom"])["coordinates"]
         for i in range(len(coords)-1):
             total += distance((coords[i][1], coords[i][0]), (coords[i+1][1], coords[i+1][0])).meters
-    return round(total)
+    return total
+
+
+# building-to-building routes with pgr_dijkstra/pgr_ksp. parameters: closed node ids, the start
+# building five times, the end building five times, the overlap threshold and the route count
+ROUTES_QUERY = """
+    WITH closed AS (
+        -- nodes shut by a scheduled closure window that is active right now
+        SELECT %s::bigint[] AS ids
+    ),
+    open_nodes AS (
+        SELECT * FROM nodes WHERE id <> ALL((SELECT ids FROM closed))
+    ),
+    source_nodes AS (
+        SELECT id
+        FROM open_nodes
+        WHERE building = %s AND type = 'elevator'
+        UNION ALL
+        SELECT id
+        FROM open_nodes
+        WHERE building = %s AND type = 'classroom'
+        AND NOT EXISTS (SELECT 1 FROM open_nodes WHERE building = %s AND type = 'elevator')
+        UNION ALL
+        SELECT id
+        FROM open_nodes
+        WHERE building = %s AND type = 'entrance'
+        AND NOT EXISTS (SELECT 1 FROM open_nodes WHERE building = %s AND type IN ('elevator','classroom'))
+    ),
+    target_nodes AS (
+        SELECT id
+        FROM open_nodes
+        WHERE building = %s AND type = 'elevator'
+        UNION ALL
+        SELECT id
+        FROM open_nodes
+        WHERE building = %s AND type = 'classroom'
+        AND NOT EXISTS (SELECT 1 FROM open_nodes WHERE building = %s AND type = 'elevator')
+        UNION ALL
+        SELECT id
+        FROM open_nodes
+        WHERE building = %s AND type = 'entrance'
+        AND NOT EXISTS (SELECT 1 FROM open_nodes WHERE building = %s AND type IN ('elevator','classroom'))
+    ),
+    sink_nodes AS (
+        -- A start node is never its own destination, so targets that are also
+        -- sources are left out (as RoutingGraph.best_pair does)
+        SELECT id FROM target_nodes WHERE id NOT IN (SELECT id FROM source_nodes)
+    ),
+    super_path AS (
+        -- One search from a virtual super-source (-1) tied to every source node
+        -- to a virtual super-sink (-2) tied to every sink node
+        SELECT *
+        FROM pgr_dijkstra(
+            format(
+                'SELECT id, source, target, cost FROM edges
+                 WHERE source <> ALL(%%3$L::bigint[]) AND target <> ALL(%%3$L::bigint[])
+                 UNION ALL SELECT -2 * id, -1, id, 0 FROM nodes WHERE id = ANY(%%1$L::bigint[])
+                 UNION ALL SELECT -2 * id - 1, id, -2, 0 FROM nodes WHERE id = ANY(%%2$L::bigint[])',
+                (SELECT array_agg(id) FROM source_nodes),
+                (SELECT array_agg(id) FROM sink_nodes),
+                (SELECT ids FROM closed)
+            ),
+            -1, -2, false
+        )
+    ),
+    same_set_pair AS (
+        -- Every target is also a source (both ends in the same building): the
+        -- cheapest pair of two different nodes. Only searched in that case, the
+        -- lateral arrays are NULL otherwise
+        SELECT d.start_vid AS source_id, d.end_vid AS target_id
+        FROM (SELECT NOT EXISTS (SELECT 1 FROM sink_nodes) AS needed) s,
+        LATERAL pgr_dijkstra(
+            format(
+                'SELECT id, source, target, cost FROM edges
+                 WHERE source <> ALL(%%1$L::bigint[]) AND target <> ALL(%%1$L::bigint[])',
+                (SELECT ids FROM closed)
+            ),
+            CASE WHEN s.needed THEN ARRAY(SELECT id FROM source_nodes) END,
+            CASE WHEN s.needed THEN ARRAY(SELECT id FROM target_nodes) END,
+            false
+        ) d
+        WHERE s.needed AND d.edge = -1 AND d.start_vid <> d.end_vid
+        ORDER BY d.agg_cost
+        LIMIT 1
+    ),
+    pairs AS (
+        -- The real nodes next to the virtual ends are the chosen pair
+        SELECT COALESCE(
+                   (SELECT source_id FROM same_set_pair),
+                   (SELECT node FROM super_path WHERE path_seq = 2)
+               ) AS source_id,
+               COALESCE(
+                   (SELECT target_id FROM same_set_pair),
+                   (SELECT node FROM super_path ORDER BY path_seq DESC OFFSET 1 LIMIT 1)
+               ) AS target_id
+    ),
+    raw_paths AS (
+        SELECT *
+        FROM pgr_ksp(
+            format(
+                'SELECT id, source, target, cost FROM edges
+                 WHERE source <> ALL(%%1$L::bigint[]) AND target <> ALL(%%1$L::bigint[])',
+                (SELECT ids FROM closed)
+            ),
+            (SELECT source_id FROM pairs),
+            (SELECT target_id FROM pairs),
+            10,   -- generate 10 paths
+            false, false
+        )
+    ),
+    shortest_edges AS (
+        SELECT edge FROM raw_paths WHERE path_id = 1 AND edge IS NOT NULL
+    ),
+    overlap AS (
+        SELECT path_id,
+            COUNT(*) FILTER (WHERE edge IN (SELECT edge FROM shortest_edges))::float
+            / NULLIF(COUNT(*),0) AS overlap_ratio
+        FROM raw_paths
+        WHERE edge IS NOT NULL
+        GROUP BY path_id
+    ),
+    filtered AS (
+        -- Every node of the kept paths, the final node has no outgoing edge
+        SELECT p.path_id, p.seq, p.agg_cost, p.node, ST_AsGeoJSON(e.geom) AS geom
+        FROM raw_paths p
+        JOIN overlap o ON p.path_id = o.path_id
+        LEFT JOIN edges e ON p.edge = e.id
+        WHERE (p.path_id = 1 OR o.overlap_ratio <= %s)
+    ),
+    total_cost AS (
+        SELECT path_id,
+            MAX(agg_cost) AS total_cost
+        FROM filtered
+        WHERE geom IS NOT NULL
+        GROUP BY path_id
+    ),
+    ranked AS (
+        SELECT path_id,
+            ROW_NUMBER() OVER (ORDER BY total_cost) AS cost_rank
+        FROM total_cost
+    )
+    SELECT f.path_id AS pgr_path_id,
+        ROW_NUMBER() OVER (PARTITION BY f.path_id ORDER BY f.seq) AS seq,
+        r.cost_rank AS route_rank,
+        f.agg_cost,
+        f.geom,
+        n.id, n.type, n.building, n.floor, n.angle,
+        ST_X(n.geom) AS lng, ST_Y(n.geom) AS lat
+    FROM filtered f
+    JOIN ranked r ON f.path_id = r.path_id
+    JOIN nodes n ON f.node = n.id
+    WHERE (f.path_id = 1 OR (r.cost_rank <= %s AND f.path_id <> 1))
+    ORDER BY route_rank, seq;
+    """
+
+
+# ranked routes between two buildings in the shape selection.html expects, plus the
+# node sequence of each route keyed by pgr_path_id. closed_nodes are left out of the search
+def compute_routes(start, end, closed_nodes=frozenset()):
+    cur = get_conn().cursor()
+    count = app.config["ROUTE_COUNT"]
+    max_overlap = app.config["ROUTE_MAX_OVERLAP"]
+    # a start snapped from gps is a single node the building-based query can't express
+    if app.config["ROUTING_ENGINE"] == "memory" or start.startswith(routing.NODE_PREFIX):
+        graph = routing.get_graph(get_conn())
+        found = graph.find_routes(
+            start, end, max_overlap=max_overlap, count=count, closed_nodes=closed_nodes,
+            method=app.config["ROUTE_ALTERNATIVES"]
+        )
+        rows = graph.route_rows(found)
+    else:
+        cur.execute(ROUTES_QUERY, (
+            sorted(closed_nodes), start, start, start, start, start, end, end, end, end, end, max_overlap, count
+        ))
+        rows = cur.fetchall()
+    cur.close()
+
+    routes = {}
+    directions = {}
+
+    for pgr_path_id, seq, route_rank, agg_cost, geom, *node in rows:
+        directions.setdefault(pgr_path_id, []).append(direction_step(seq, node))
+        if geom is None:
+            continue
+        route_key = str(route_rank)
+        entry = {"seq": seq, "geom": geom, "pgr_path_id": pgr_path_id}
+        routes.setdefault(route_key, []).append(entry)
+
+    routes_final = {}
+    for rank, items in routes.items():
+        geoms = [{"seq": it["seq"], "geom": it["geom"]} for it in items]
+        routes_final[rank] = dict(
+            route_summary(geoms),
+            pgr_path_id=items[0]["pgr_path_id"],
+            start_building=MY_LOCATION_LABEL if start.startswith(routing.NODE_PREFIX) else start,
+            end_building=end
+        )
+
+    routes = {k: routes_final[k] for k in sorted(routes_final, key=int)[:count]}
+    kept = {r["pgr_path_id"] for r in routes.values()}
+    return routes, {path_id: nodes for path_id, nodes in directions.items() if path_id in kept}
+
+
+# scheduled closures active right now as (window key, closed node ids, next boundary)
+def current_window():
+    schedule = closure_schedule.loaded_schedule() or closure_schedule.get_schedule(get_conn())
+    return schedule.window()
+
+
+# one node of a route's directions, from the node columns of a route row
+def direction_step(seq, node):
+    return {
+        "seq": seq, "id": node[0], "type": node[1], "building": node[2],
+        "floor": node[3], "angle": node[4], "lng": node[5], "lat": node[6]
+    }
+
+
+# length, walking time and geometry of a route from its per-edge geometries
+def route_summary(geoms):
+    total_meters = compute_route_length_meters(geoms)
+    # measured on the full edges, then sent and starred as a single merged geometry
+    merged = geometry.merged_route_geometry(geoms, app.config["ROUTE_SIMPLIFY_ZOOM"])
+    return {
+        "geoms": [{"seq": 1, "geom": json.dumps(merged)}],
+        "meters": total_meters,
+        "time_min": round(total_meters / 50)
+    }
+
+
+# compute a route set and the token it is saved under, window is the scheduled closure window
+# it is valid for (the default is no closures, which is what the precomputed table holds)
+def build_route_set(start, end, window=("", frozenset())):
+    key = (start, end, routing.graph_version(), window[0])
+    routes, directions = compute_routes(start, end, window[1])
+    token = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()[:16]
+    for route in routes.values():
+        route["route_set"] = token
+    return {"token": token, "routes": routes, "directions": directions}
+
+
+# route table and executor workers run outside a request, so each job gets its own app context
+# and connection
+def build_route_set_background(start, end, window=("", frozenset())):
+    with app.app_context():
+        return build_route_set(start, end, window)
+
+
+# executor job for a cache miss, cached before the waiters it was coalesced for are released
+def compute_and_cache(key, start, end, window):
+    route_set = build_route_set_background(start, end, window)
+    route_cache.put(key, route_set)
+    return route_set
+
+
+# route set for a building pair from the precomputed table or the cache, computed on a miss.
+# the cache key includes the closure window, so cached routes roll over at window boundaries
+def get_route_set(start, end):
+    window = current_window()
+    # the table is built without scheduled closures, skip it while any are active
+    route_set = route_table.get(start, end) if route_table and not window[1] else None
+    if route_set is None:
+        key = (start, end, routing.graph_version(), window[0])
+        route_set = route_cache.get(key)
+        if route_set is None:
+            # the job checks out a connection of its own, so don't sit on this one while waiting:
+            # a burst of waiters holding every connection would starve the job that frees them
+            release_conn()
+            # identical requests arriving together wait on the same computation
+            route_set = route_executor.run(
+                key, compute_and_cache, key, start, end, window,
+                timeout=app.config["ROUTE_WAIT_TIMEOUT"]
+            )
+    saved_route_sets.put(route_set["token"], route_set)
+    return route_set
+
+
+# routes in the configured payload format, the compact form is encoded once per route set
+def route_payload(route_set):
+    if app.config["ROUTE_PAYLOAD"] != "compact":
+        return route_set["routes"]
+
+    if "compact_routes" not in route_set:
+        compact = {}
+        for rank, route in route_set["routes"].items():
+            compact[rank] = {k: v for k, v in route.items() if k != "geoms"}
+            compact[rank]["polylines"] = [
+                geometry.encode_polyline(coords) for coords in geometry.edge_coordinates(route["geoms"])
+            ]
+        route_set["compact_routes"] = compact
+    return route_set["compact_routes"]
+
+
+# directions as one array per attribute, with the node positions as an encoded polyline
+def columnar_directions(nodes):
+    return {
+        "format": "columnar",
+        "seq": [n["seq"] for n in nodes],
+        "id": [n["id"] for n in nodes],
+        "type": [n["type"] for n in nodes],
+        "building": [n["building"] for n in nodes],
+        "floor": [n["floor"] for n in nodes],
+        "angle": [n["angle"] for n in nodes],
+        "coords": geometry.encode_polyline([(n["lng"], n["lat"]) for n in nodes]) if nodes else ""
+    }
+
+
+# route set the user was shown, so navigation and starring never recompute it. when it has been
+# evicted it is computed again, which can raise RouteTimeout
+def get_saved_route_set(token=None):
+    token = token or session.get("route_set")
+    if token:
+        route_set = saved_route_sets.get(token)
+        if route_set is not None:
+            return route_set
+
+    start_building = session.get("start")
+    end_building = session.get("end")
+    if not start_building or not end_building:
+        return None
+    return get_route_set(start_building, end_building)
+
+
+# identifies the state of the routable graph across restarts
+def graph_fingerprint():
+    cur = get_conn().cursor()
+    cur.execute("""
+        SELECT md5(COALESCE(string_agg(id::text, ',' ORDER BY id), '')),
+               (SELECT COUNT(*) FROM edges)
+        FROM removed_nodes
+    """)
+    row = cur.fetchone()
+    cur.close()
+    return f"{row[0]}:{row[1]}"
+
+
+# called with a closures.py delta after nodes are closed or reopened
+def graph_changed(delta):
+    routing.apply_graph_delta(delta)
+    route_cache.clear()
+    broadcaster.publish("closure", {
+        "closed_nodes": delta["closed_nodes"],
+        "opened_nodes": delta["opened_nodes"]
+    })
+    if route_table:
+        removed = [n["id"] for n in delta["closed_nodes"]]
+        restored = [n["id"] for n in delta["opened_nodes"]]
+        if removed:
+            route_table.nodes_removed(removed, graph_fingerprint())
+        if restored:
+            buildings = {n["building"] for n in delta["opened_nodes"]}
+            route_table.nodes_restored(restored, buildings, graph_fingerprint())
+
+
+# forget everything derived from the graph tables, after a reload or when this process fell too
+# far behind the change log to replay it
+def reset_graph_state():
+    global route_table
+    routing.invalidate_graph()
+    route_cache.clear()
+    with map_bootstrap_lock:
+        map_bootstrap.clear()
+    closure_schedule.invalidate_schedule()
+    # an import can change costs and geometry without changing the fingerprint, so never reuse the saved table
+    if route_table:
+        route_table = RouteTable(build_route_set_background, routing.graph_version, app.config["ROUTE_TABLE_PATH"])
+        start_route_table(reuse_saved=False)
+
+
+# apply the changes other processes (and this one) added to graph_changes since the last call.
+# returns False when there is no shared log to read. the check runs on every request, so it borrows
+# a connection just for the read instead of taking the request's for its whole lifetime
+def sync_graph_changes():
+    if graph_sync["version"] is None:
+        return False
+    conn = db_pool.getconn()
+    try:
+        changes = graph_changes.changes_since(conn, graph_sync["version"])
+    finally:
+        db_pool.putconn(conn)
+    if changes is None:
+        return False
+    if not changes:
+        return True
+
+    with graph_sync_lock:
+        for version, kind, delta in changes:
+            seen = graph_sync["version"]
+            # another thread applied it while this one was reading
+            if version <= seen:
+                continue
+            # the rows in between were pruned or rolled back, replaying from here could miss closures
+            if version != seen + 1:
+                reset_graph_state()
+                graph_sync["version"] = changes[-1][0]
+                break
+            if kind == "closure":
+                graph_changed(delta)
+            elif kind == "schedule":
+                closure_schedule.invalidate_schedule()
+            elif kind in graph_changes.EVENT_KINDS:
+                broadcaster.publish(kind, delta)
+            else:
+                reset_graph_state()
+            graph_sync["version"] = version
+    return True
+
+
+# apply a closure this process just committed, through the log when it was recorded there so it
+# is applied exactly once
+def apply_closure(delta):
+    if delta["version"] is None or not sync_graph_changes():
+        graph_changed(delta)
+
+
+# publish an /events message recorded in graph_changes, through the log so every process sends it
+# to its own streams, or only to this process's streams when it wasn't recorded
+def publish_event(kind, data, version):
+    if version is None or not sync_graph_changes():
+        broadcaster.publish(kind, data)
+
+
+# record and publish an /events message outside any request transaction, for asgi.py's endpoints
+def share_event(kind, data):
+    with app.app_context():
+        version = None
+        try:
+            conn = db_pool.getconn()
+            try:
+                version = graph_changes.record_change(conn, kind, data)
+            finally:
+                db_pool.putconn(conn)
+        except Exception as e:
+            print("EVENT LOG ERROR:", e)
+        publish_event(kind, data, version)
+
+
+# changes already in the log when this process starts are part of the tables it loads from
+def start_graph_sync():
+    conn = db_pool.getconn()
+    try:
+        graph_sync["version"] = graph_changes.latest_version(conn)
+    finally:
+        db_pool.putconn(conn)
+    if graph_sync["version"] is None or app.config["GRAPH_SYNC_INTERVAL"] <= 0:
+        return
+
+    def poll():
+        while True:
+            time.sleep(app.config["GRAPH_SYNC_INTERVAL"])
+            try:
+                with app.app_context():
+                    sync_graph_changes()
+            except Exception as e:
+                print("GRAPH SYNC ERROR:", e)
+
+    threading.Thread(target=poll, daemon=True).start()
+
+
+# fill the precomputed route table in the background, reusing the saved file when still valid
+def start_route_table(reuse_saved=True):
+    def build():
+        with app.app_context():
+            build_table()
+
+    def build_table():
+        fingerprint = graph_fingerprint()
+        if reuse_saved and route_table.load(fingerprint):
+            return
+        cur = get_conn().cursor()
+        cur.execute("SELECT DISTINCT building FROM nodes WHERE building IS NOT NULL ORDER BY building")
+        buildings = [row[0] for row in cur.fetchall()]
+        cur.close()
+        route_table.build(buildings, fingerprint)
+
+    threading.Thread(target=build, daemon=True).start()
 
 
 # pages that require login
@@ -41,6 +679,13 @@ def require_login():
         return redirect('/')
 
 
+# apply closures made in other worker processes before answering
+@app.before_request
+def sync_graph():
+    if request.endpoint != 'static':
+        sync_graph_changes()
+
+
 @app.route('/')
 def home():
     return render_template('login.html')
@@ -53,7 +698,7 @@ def login():
         username = request.form['username']
         password_hash = request.form['password']
 
-        cur = map_conn.cursor()
+        cur = get_conn().cursor()
 
         cur.execute(
             sql.SQL("SELECT user_id, email, is_admin FROM users WHERE username = %s AND password_hash = %s"),
@@ -83,7 +728,7 @@ def create_account():
         username = request.form['username']
         password = request.form['password']
 
-        cur = map_conn.cursor()
+        cur = get_conn().cursor()
 
         cur.execute("SELECT 1 FROM users WHERE email = %s OR username = %s", (email, username))
         exists = cur.fetchone()
@@ -98,7 +743,7 @@ def create_account():
             [email, username, password]
         )
 
-        map_conn.commit()
+        get_conn().commit()
         cur.close()
 
         return render_template('create_acc.html', success="Account created successfully!")
@@ -106,146 +751,17 @@ def create_account():
     return render_template('create_acc.html')
 
 
-# main map page, includes sql queries to get shortest path(s), reported nodes, etc.
-@app.route('/map', methods=['POST', 'GET'])
-def view_map():
-    cur = map_conn.cursor()
+# buildings for /map and the nodes of the reports map layer, reloaded only when the graph version changes
+def get_map_bootstrap():
+    version = routing.graph_version()
+    with map_bootstrap_lock:
+        if map_bootstrap.get("version") == version:
+            return map_bootstrap
+
+    cur = get_conn().cursor()
     cur.execute("SELECT DISTINCT building FROM nodes ORDER BY building")
     buildings = [row[0] for row in cur.fetchall()]
 
-    routes = {}
-    report_nodes = []
-
-    if request.method == 'POST':
-        start = request.form['startLocation']
-        end = request.form['endLocation']
-
-        session['start'] = start
-        session['end'] = end
-
-        cur = map_conn.cursor()
-
-        query = """
-        WITH source_nodes AS (
-            SELECT id
-            FROM nodes
-            WHERE building = %s AND type = 'elevator'
-            UNION ALL
-            SELECT id
-            FROM nodes
-            WHERE building = %s AND type = 'classroom'
-            AND NOT EXISTS (SELECT 1 FROM nodes WHERE building = %s AND type = 'elevator')
-            UNION ALL
-            SELECT id
-            FROM nodes
-            WHERE building = %s AND type = 'entrance'
-            AND NOT EXISTS (SELECT 1 FROM nodes WHERE building = %s AND type IN ('elevator','classroom'))
-        ),
-        target_nodes AS (
-            SELECT id
-            FROM nodes
-            WHERE building = %s AND type = 'elevator'
-            UNION ALL
-            SELECT id
-            FROM nodes
-            WHERE building = %s AND type = 'classroom'
-            AND NOT EXISTS (SELECT 1 FROM nodes WHERE building = %s AND type = 'elevator')
-            UNION ALL
-            SELECT id
-            FROM nodes
-            WHERE building = %s AND type = 'entrance'
-            AND NOT EXISTS (SELECT 1 FROM nodes WHERE building = %s AND type IN ('elevator','classroom'))
-        ),
-        pairs AS (
-            -- Compute all pairs and pick the shortest path among them
-            SELECT s.id AS source_id, t.id AS target_id
-            FROM source_nodes s
-            CROSS JOIN target_nodes t
-            ORDER BY (
-                SELECT agg_cost
-                FROM pgr_dijkstra(
-                    'SELECT id, source, target, cost FROM edges',
-                    s.id, t.id, false
-                )
-                ORDER BY agg_cost DESC
-                LIMIT 1
-            )
-            LIMIT 1
-        ),
-        raw_paths AS (
-            SELECT *
-            FROM pgr_ksp(
-                'SELECT id, source, target, cost FROM edges',
-                (SELECT source_id FROM pairs),
-                (SELECT target_id FROM pairs),
-                10,   -- generate 10 paths
-                false, false
-            )
-        ),
-        shortest_edges AS (
-            SELECT edge FROM raw_paths WHERE path_id = 1 AND edge IS NOT NULL
-        ),
-        overlap AS (
-            SELECT path_id,
-                COUNT(*) FILTER (WHERE edge IN (SELECT edge FROM shortest_edges))::float
-                / NULLIF(COUNT(*),0) AS overlap_ratio
-            FROM raw_paths
-            WHERE edge IS NOT NULL
-            GROUP BY path_id
-        ),
-        filtered AS (
-            SELECT p.path_id, p.seq, p.agg_cost, ST_AsGeoJSON(e.geom) AS geom
-            FROM raw_paths p
-            JOIN overlap o ON p.path_id = o.path_id
-            JOIN edges e ON p.edge = e.id
-            WHERE (p.path_id = 1 OR o.overlap_ratio <= 0.6)
-        ),
-        total_cost AS (
-            SELECT path_id,
-                MAX(agg_cost) AS total_cost
-            FROM filtered
-            GROUP BY path_id
-        ),
-        ranked AS (
-            SELECT path_id,
-                ROW_NUMBER() OVER (ORDER BY total_cost) AS cost_rank
-            FROM total_cost
-        )
-        SELECT f.path_id AS pgr_path_id,
-            ROW_NUMBER() OVER (PARTITION BY f.path_id ORDER BY f.seq) AS seq,
-            r.cost_rank AS route_rank,
-            f.agg_cost,
-            f.geom
-        FROM filtered f
-        JOIN ranked r ON f.path_id = r.path_id
-        WHERE (f.path_id = 1 OR (r.cost_rank <= 3 AND f.path_id <> 1))
-        ORDER BY route_rank, seq;
-        """
-
-        cur.execute(query, (start, start, start, start, start, end, end, end, end, end))
-        rows = cur.fetchall()
-
-        for pgr_path_id, seq, route_rank, agg_cost, geom in rows:
-            route_key = str(route_rank)
-            entry = {"seq": seq, "geom": geom, "pgr_path_id": pgr_path_id}
-            routes.setdefault(route_key, []).append(entry)
-
-        routes_final = {}
-        for rank, items in routes.items():
-            geoms = [{"seq": it["seq"], "geom": it["geom"]} for it in items]
-            pgr_id = items[0]["pgr_path_id"]
-            total_meters = compute_route_length_meters(geoms)
-            routes_final[rank] = {
-                "geoms": geoms,
-                "meters": total_meters,
-                "time_min": round(total_meters / 50),
-                "pgr_path_id": pgr_id,
-                "start_building": start,
-                "end_building": end
-            }
-
-        routes = {k: routes_final[k] for k in sorted(routes_final.keys())[:3]}
-
     cur.execute("""
         SELECT id, type, name, building, ST_X(geom) AS lng, ST_Y(geom) AS lat
         FROM nodes
@@ -267,7 +783,120 @@ def view_map():
         {"id": r[0], "type": r[1], "name": r[2], "building": r[3], "lng": r[4], "lat": r[5]} 
         for r in removed_nodes_rows
     ]
+    cur.close()
+
+    bootstrap = {
+        "version": version,
+        "buildings": buildings,
+        "report_nodes": report_nodes,
+        "removed_nodes": removed_nodes
+    }
+    with map_bootstrap_lock:
+        # a graph change while loading means this copy may be stale, serve it once but don't keep it
+        if routing.graph_version() == version:
+            map_bootstrap.clear()
+            map_bootstrap.update(bootstrap)
+    return bootstrap
+
+
+# buildings come from a file, the other layers follow the graph
+def map_layer_version(name):
+    return 0 if name == "buildings" else routing.graph_version()
+
+
+# features of one tiled map layer, rebuilt when the graph version changes
+def get_map_layer(name):
+    version = map_layer_version(name)
+    with map_layers_lock:
+        cached = map_layers.get(name)
+        if cached and cached[0] == version:
+            return cached
+
+    if name == "network":
+        graph = routing.loaded_graph() or routing.get_graph(get_conn())
+        features = map_tiles.network_features(graph)
+    elif name == "buildings":
+        with open(app.config["BUILDINGS_PATH"]) as f:
+            buildings = json.load(f)
+        features = [
+            map_tiles.point_feature(lng, lat, {"name": building})
+            for building, (lat, lng) in sorted(buildings.items())
+        ]
+    else:
+        bootstrap = get_map_bootstrap()
+        features = [
+            map_tiles.point_feature(n["lng"], n["lat"], {
+                "id": n["id"], "type": n["type"], "name": n["name"], "building": n["building"], "removed": removed
+            })
+            for key, removed in (("report_nodes", False), ("removed_nodes", True))
+            for n in bootstrap[key]
+        ]
+
+    layer = MAP_LAYERS[name]
+    tiles = map_tiles.TileLayer(features, layer["min_zoom"], layer["max_zoom"], simplify=name == "network")
+    with map_layers_lock:
+        if map_layer_version(name) == version:
+            map_layers[name] = (version, tiles)
+    return version, tiles
+
+
+# one tile of a map layer as GeoJSON, so the page only fetches what is on screen. tiles are
+# revalidated by ETag, which changes whenever the tile's content does
+@app.route('/map/tiles/<layer>/<int:z>/<int:x>/<int:y>.json')
+def map_tile(layer, z, x, y):
+    if layer not in MAP_LAYERS:
+        abort(404)
+    if not map_tiles.valid_tile(z, x, y):
+        abort(400)
+
+    version, tiles = get_map_layer(layer)
+    key = (layer, version, z, x, y)
+    cached = map_tile_cache.get(key)
+    if cached is None:
+        body = json.dumps(tiles.tile(z, x, y), separators=(",", ":"))
+        cached = (body, hashlib.sha256(body.encode("utf-8")).hexdigest()[:32])
+        map_tile_cache.put(key, cached)
+
+    response = Response(cached[0], mimetype="application/json")
+    response.set_etag(cached[1])
+    response.headers["Cache-Control"] = MAP_LAYERS[layer]["cache_control"]
+    return response.make_conditional(request)
 
+
+# main map page, includes sql queries to get shortest path(s), reported nodes, etc.
+@app.route('/map', methods=['POST', 'GET'])
+def view_map():
+    routes = {}
+    route_error = None
+
+    if request.method == 'POST':
+        start = request.form['startLocation']
+        end = request.form['endLocation']
+
+        # route from the user's position, snapped to the nearest open node so it can be cached
+        if start == MY_LOCATION:
+            start = snap_location(request.form.get('startLng', type=float), request.form.get('startLat', type=float))
+            if start is None:
+                route_error = "No open path was found near your location."
+
+        session['start'] = start
+        session['end'] = end
+
+        if start:
+            try:
+                route_set = get_route_set(start, end)
+            except RouteTimeout:
+                print("Route computation timed out for", start, "->", end)
+                abort(503)
+            except PoolError as e:
+                print("Route computation got no database connection:", e)
+                abort(503)
+            session['route_set'] = route_set["token"]
+            routes = route_payload(route_set)
+
+    bootstrap = get_map_bootstrap()
+
+    cur = get_conn().cursor()
     user_settings = {"mode": "light", "live_updates": False, "voice_over": False}
     user_id = session.get("user_id")
     if user_id:
@@ -288,108 +917,33 @@ def view_map():
 
     return render_template(
         'selection.html',
-        buildings=buildings,
+        buildings=bootstrap["buildings"],
         routes=routes,
-        report_nodes=report_nodes,
+        route_error=route_error,
         is_admin=session.get("is_admin"),
         mode=user_settings["mode"],
         live_updates=user_settings["live_updates"],
-        voice_over=user_settings["voice_over"],
-        removed_nodes=removed_nodes
+        voice_over=user_settings["voice_over"]
     )
 
 
-# given the path id, returns a list of nodes and their attributes
+# given the path id, returns a list of nodes and their attributes from the saved route set
 @app.route('/directions/<int:pgr_path_id>')
 def get_directions(pgr_path_id):
-    start_building = session.get('start')
-    end_building = session.get('end')
-
-    if not start_building or not end_building:
+    try:
+        route_set = get_saved_route_set(request.args.get("route_set"))
+    except RouteTimeout:
+        print("Route computation timed out for", session.get("start"), "->", session.get("end"))
+        return jsonify({"error": "Route computation timed out, try again shortly"}), 503
+    except PoolError as e:
+        print("Route computation got no database connection:", e)
+        return jsonify({"error": "Server busy, try again shortly"}), 503
+    if route_set is None:
         return jsonify({"error": "Start/end not set"}), 400
 
-    cur = map_conn.cursor()
-
-    query = """
-    WITH source_nodes AS (
-        SELECT id
-        FROM nodes
-        WHERE building = %s AND type = 'elevator'
-        UNION ALL
-        SELECT id
-        FROM nodes
-        WHERE building = %s AND type = 'classroom'
-          AND NOT EXISTS (SELECT 1 FROM nodes WHERE building = %s AND type = 'elevator')
-        UNION ALL
-        SELECT id
-        FROM nodes
-        WHERE building = %s AND type = 'entrance'
-          AND NOT EXISTS (SELECT 1 FROM nodes WHERE building = %s AND type IN ('elevator','classroom'))
-    ),
-    target_nodes AS (
-        SELECT id
-        FROM nodes
-        WHERE building = %s AND type = 'elevator'
-        UNION ALL
-        SELECT id
-        FROM nodes
-        WHERE building = %s AND type = 'classroom'
-          AND NOT EXISTS (SELECT 1 FROM nodes WHERE building = %s AND type = 'elevator')
-        UNION ALL
-        SELECT id
-        FROM nodes
-        WHERE building = %s AND type = 'entrance'
-          AND NOT EXISTS (SELECT 1 FROM nodes WHERE building = %s AND type IN ('elevator','classroom'))
-    ),
-    pairs AS (
-        SELECT s.id AS source_id, t.id AS target_id
-        FROM source_nodes s
-        CROSS JOIN target_nodes t
-        ORDER BY (
-            SELECT agg_cost
-            FROM pgr_dijkstra(
-                'SELECT id, source, target, cost FROM edges',
-                s.id, t.id, false
-            )
-            ORDER BY agg_cost DESC
-            LIMIT 1
-        )
-        LIMIT 1
-    ),
-    raw_paths AS (
-        SELECT *
-        FROM pgr_ksp(
-            'SELECT id, source, target, cost FROM edges',
-            (SELECT source_id FROM pairs),
-            (SELECT target_id FROM pairs),
-            10,
-            false, false
-        )
-    )
-    SELECT p.seq,
-           n.id, n.type, n.building, n.floor, n.angle,
-           ST_X(n.geom) AS lng, ST_Y(n.geom) AS lat
-    FROM raw_paths p
-    JOIN nodes n ON p.node = n.id
-    WHERE p.path_id = %s
-    ORDER BY p.seq;
-    """
-
-    cur.execute(query, (
-    start_building, start_building, start_building, start_building, start_building,
-    end_building, end_building, end_building, end_building, end_building,
-    pgr_path_id
-    ))
-    rows = cur.fetchall()
-    cur.close()
-
-    nodes = [
-        {
-            "seq": r[0], "id": r[1], "type": r[2], "building": r[3],
-            "floor": r[4], "angle": r[5], "lng": r[6], "lat": r[7]
-        }
-        for r in rows
-    ]
+    nodes = route_set["directions"].get(pgr_path_id, [])
+    if app.config["ROUTE_PAYLOAD"] == "compact":
+        return jsonify(columnar_directions(nodes))
     return jsonify(nodes)
 
 
@@ -404,6 +958,22 @@ def star_route():
     route_json = data.get("route_json")
     star_name = data.get("name")
     directions = data.get("directions")
+    pgr_path_id = data.get("pgr_path_id")
+
+    # generated routes are read back from the saved route set instead of trusting the client copy
+    try:
+        route_set = get_saved_route_set(data.get("route_set")) if pgr_path_id else None
+    except RouteTimeout:
+        print("Route computation timed out for", session.get("start"), "->", session.get("end"))
+        return jsonify({"error": "Route computation timed out, try again shortly"}), 503
+    except PoolError as e:
+        print("Route computation got no database connection:", e)
+        return jsonify({"error": "Server busy, try again shortly"}), 503
+    if route_set is not None:
+        saved = next((r for r in route_set["routes"].values() if r["pgr_path_id"] == pgr_path_id), None)
+        if saved is not None:
+            route_json = {"geoms": saved["geoms"]}
+            directions = route_set["directions"].get(pgr_path_id)
 
     if route_json is None:
         return jsonify({"error": "Missing route_json"}), 400
@@ -428,7 +998,7 @@ def star_route():
     except Exception as e:
         return jsonify({"error": f"Invalid route_json: {e}"}), 400
 
-    cur = map_conn.cursor()
+    cur = get_conn().cursor()
     try:
         cur.execute("""
             SELECT 1 FROM starred_routes
@@ -448,9 +1018,9 @@ def star_route():
             json.dumps(feature_collection),
             json.dumps(directions) if directions else None
         ))
-        map_conn.commit()
+        get_conn().commit()
     except Exception as e:
-        map_conn.rollback()
+        get_conn().rollback()
         return jsonify({"error": str(e)}), 500
     finally:
         cur.close()
@@ -458,28 +1028,111 @@ def star_route():
     return jsonify({"success": True})
 
 
+# "node:<id>" start for a gps position, or None when there is no open node close enough
+def snap_location(lng, lat):
+    if lng is None or lat is None:
+        return None
+    graph = routing.loaded_graph() or routing.get_graph(get_conn())
+    found = graph.nearest_node(
+        lng, lat, max_m=app.config["REROUTE_MAX_SNAP_M"], closed_nodes=current_window()[1]
+    )
+    if found is None:
+        return None
+    return routing.NODE_PREFIX + str(int(graph.node_ids[found[0]]))
+
+
+# nearest open node to a position, optionally only elevators or entrances
+@app.route("/nearest")
+def nearest_node():
+    lng = request.args.get("lng", type=float)
+    lat = request.args.get("lat", type=float)
+    node_type = request.args.get("type")
+    if lng is None or lat is None:
+        return jsonify({"error": "lat and lng are required"}), 400
+    if node_type not in (None, "elevator", "entrance", "classroom"):
+        return jsonify({"error": "Unknown node type"}), 400
+
+    graph = routing.loaded_graph() or routing.get_graph(get_conn())
+    found = graph.nearest_node(lng, lat, node_type, closed_nodes=current_window()[1])
+    if found is None:
+        return jsonify({"error": "No open node found"}), 404
+
+    i, meters = found
+    return jsonify({
+        "id": int(graph.node_ids[i]),
+        "type": graph.node_types[i],
+        "building": graph.node_buildings[i],
+        "floor": graph.node_floors[i],
+        "lng": float(graph.node_coords[i][0]),
+        "lat": float(graph.node_coords[i][1]),
+        "meters": round(meters, 1)
+    })
+
+
+# checks an active navigation against closures and routes again from the user's position when
+# it is blocked. answered from the in-memory graph, so clients can call it on every closure event
+@app.route("/reroute", methods=["POST"])
+def reroute():
+    data = request.json or {}
+    try:
+        node_ids = [int(n) for n in data["node_ids"]]
+        edge_ids = [int(e) for e in data["edge_ids"]] if data.get("edge_ids") else None
+        lng = float(data["lng"])
+        lat = float(data["lat"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "node_ids, lng and lat are required"}), 400
+
+    graph = routing.loaded_graph() or routing.get_graph(get_conn())
+    result = graph.reroute(
+        node_ids, lng, lat, edge_ids,
+        closed_nodes=current_window()[1],
+        max_snap_m=app.config["REROUTE_MAX_SNAP_M"]
+    )
+    if result["status"] != "rerouted":
+        return jsonify(result)
+
+    rows = graph.route_rows([result["route"]])
+    geoms = [{"seq": r[1], "geom": r[4]} for r in rows if r[4] is not None]
+    route = route_payload({"routes": {"1": route_summary(geoms)}})["1"]
+    nodes = [direction_step(r[1], r[5:]) for r in rows]
+    return jsonify({
+        "status": "rerouted",
+        "route": route,
+        "directions": columnar_directions(nodes) if app.config["ROUTE_PAYLOAD"] == "compact" else nodes
+    })
+
+
 # admin user report to reports table
 @app.route('/submit-report', methods=['POST'])
 def submit_report():
-    data = request.json
-    node_id = data.get("node_id")
-    description = data.get("description").strip()
+    data = request.json or {}
+    # reports are written later in batches, so a value the insert would reject has to be caught here
+    try:
+        node_id = int(data.get("node_id"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "node_id must be an integer"}), 400
+    description = data.get("description")
     node_name = data.get("node_name")
     building = data.get("building")
+    if not isinstance(description, str) or not all(v is None or isinstance(v, str) for v in (node_name, building)):
+        return jsonify({"error": "description, node_name and building must be text"}), 400
 
+    description = description.strip()
     if len(description) > 255:
         description = description[:255]
 
     user_id = session.get("user_id")
     user_email = session.get("email")
 
-    cur = map_conn.cursor()
-    cur.execute("""
-        INSERT INTO reports (user_id, user_email, node_id, node_name, building, description)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """, (user_id, user_email, node_id, node_name, building, description))
-    map_conn.commit()
-    return jsonify({"status": "success"})
+    status = report_queue.submit(
+        (user_id or user_email, node_id),
+        (user_id, user_email, node_id, node_name, building, description)
+    )
+    if status == "full":
+        response = jsonify({"status": "busy", "error": "Too many reports right now, try again shortly"})
+        response.headers["Retry-After"] = str(max(1, round(app.config["REPORT_FLUSH_SECONDS"])))
+        return response, 503
+    return jsonify({"status": status})
 
 
 def admin_required(f):
@@ -491,38 +1144,41 @@ def admin_required(f):
     return decorated_function
 
 
-# returns a list of user submitted reports in the last month
+# reported nodes of the last month with their report counts, read from the report_counts buckets
+# that sql/report_summary.sql keeps up to date; the reports themselves come from /admin/node-reports
 @app.route("/admin/report-summary")
 @admin_required
 def admin_report_summary():
-    cur = map_conn.cursor()
+    cur = get_conn().cursor()
     try:
         query = """
-        SELECT r.node_id,
+        WITH counts AS (
+            SELECT node_id, SUM(report_count) AS report_count
+            FROM report_counts
+            WHERE day >= (NOW() - INTERVAL '1 month')::date
+            GROUP BY node_id
+        )
+        SELECT c.node_id,
                COALESCE(n.name, rn.name) AS name,
                COALESCE(n.building, rn.building) AS building,
                COALESCE(ST_Y(n.geom), ST_Y(rn.geom)) AS lat,
                COALESCE(ST_X(n.geom), ST_X(rn.geom)) AS lng,
                COALESCE(n.type, rn.type) AS type,
-               COUNT(*) AS report_count,
-               JSON_AGG(
-                   JSON_BUILD_OBJECT(
-                       'email', r.user_email,
-                       'reported_at', r.created_at,
-                       'description', r.description
-                   )
-               ) AS reports,
-               CASE WHEN n.id IS NOT NULL THEN TRUE ELSE FALSE END AS in_use
-        FROM reports r
-        LEFT JOIN nodes n ON r.node_id = n.id
-        LEFT JOIN removed_nodes rn ON r.node_id = rn.id
-        WHERE r.created_at >= NOW() - INTERVAL '1 month'
-        GROUP BY r.node_id, n.id, rn.id, n.name, rn.name, n.building, rn.building, n.geom, rn.geom, n.type, rn.type
+               c.report_count,
+               n.id IS NOT NULL AS in_use
+        FROM counts c
+        LEFT JOIN nodes n ON c.node_id = n.id
+        LEFT JOIN removed_nodes rn ON c.node_id = rn.id
         ORDER BY report_count DESC, building ASC, name ASC;
         """
-        cur.execute(query)
+        try:
+            cur.execute(query)
+        except errors.UndefinedTable:
+            # report_counts not created yet, count the reports directly
+            get_conn().rollback()
+            cur.execute(LIVE_REPORT_SUMMARY_QUERY)
         results = cur.fetchall()
-        
+
         data = [
             {
                 "node_id": r[0],
@@ -531,9 +1187,8 @@ def admin_report_summary():
                 "lat": r[3],
                 "lng": r[4],
                 "type": r[5],
-                "report_count": r[6],
-                "reports": r[7],
-                "in_use": r[8]
+                "report_count": int(r[6]),
+                "in_use": r[7]
             }
             for r in results
         ]
@@ -545,153 +1200,343 @@ def admin_report_summary():
         cur.close()
 
 
+LIVE_REPORT_SUMMARY_QUERY = """
+    SELECT r.node_id,
+           COALESCE(n.name, rn.name) AS name,
+           COALESCE(n.building, rn.building) AS building,
+           COALESCE(ST_Y(n.geom), ST_Y(rn.geom)) AS lat,
+           COALESCE(ST_X(n.geom), ST_X(rn.geom)) AS lng,
+           COALESCE(n.type, rn.type) AS type,
+           COUNT(*) AS report_count,
+           n.id IS NOT NULL AS in_use
+    FROM reports r
+    LEFT JOIN nodes n ON r.node_id = n.id
+    LEFT JOIN removed_nodes rn ON r.node_id = rn.id
+    WHERE r.created_at >= (NOW() - INTERVAL '1 month')::date
+    GROUP BY r.node_id, n.id, rn.id, n.name, rn.name, n.building, rn.building, n.geom, rn.geom, n.type, rn.type
+    ORDER BY report_count DESC, building ASC, name ASC;
+"""
+
+
+# one page of a node's reports from the last month, newest first; ?before=<report id> continues
+@app.route("/admin/node-reports/<int:node_id>")
+@admin_required
+def admin_node_reports(node_id):
+    limit = max(1, min(request.args.get("limit", app.config["REPORTS_PAGE_SIZE"], type=int), 200))
+    before = request.args.get("before", type=int)
+
+    cur = get_conn().cursor()
+    cur.execute("""
+        SELECT id, user_email, created_at, description
+        FROM reports
+        WHERE node_id = %s
+          AND created_at >= (NOW() - INTERVAL '1 month')::date
+          AND (%s IS NULL OR id < %s)
+        ORDER BY id DESC
+        LIMIT %s
+    """, (node_id, before, before, limit))
+    rows = cur.fetchall()
+    cur.close()
+
+    return jsonify({
+        "reports": [
+            {"id": r[0], "email": r[1], "reported_at": r[2].isoformat(), "description": r[3]}
+            for r in rows
+        ],
+        "next": rows[-1][0] if len(rows) == limit else None
+    })
+
+
 # temporarily moves node to removed nodes table and does the same for adjacent edges
 @app.route("/admin/remove-node/<int:node_id>", methods=["POST"])
 @admin_required
 def remove_node(node_id):
-    cur = map_conn.cursor()
     try:
-        cur.execute("SELECT e_group_id FROM nodes WHERE id = %s", (node_id,))
-        row = cur.fetchone()
-
-        if not row:
+        delta = closures.close_nodes(get_conn(), node_ids=[node_id], mode=app.config["CLOSURE_MODE"])
+        node = next((n for n in delta["closed_nodes"] if n["id"] == node_id), None)
+        if node is None:
             raise Exception("Node not found")
+    except Exception as e:
+        print("REMOVE NODE ERROR:", e)
+        return jsonify({"error": str(e)}), 500
 
-        e_group_id = row[0]
+    apply_closure(delta)
+    return jsonify({"success": True, "node": node})
 
-        if e_group_id is None:
-            group_nodes = [node_id]
 
-        else:
-            cur.execute("SELECT id FROM nodes WHERE e_group_id = %s", (e_group_id,))
-            group_nodes = [r[0] for r in cur.fetchall()]
+# moves node/edges back to main nodes and edges table
+@app.route("/admin/restore-node/<int:node_id>", methods=["POST"])
+@admin_required
+def restore_node(node_id):
+    try:
+        delta = closures.reopen_nodes(get_conn(), node_ids=[node_id], mode=app.config["CLOSURE_MODE"])
+        node = next((n for n in delta["opened_nodes"] if n["id"] == node_id), None)
+        if node is None:
+            raise Exception("Node not found in removed_nodes")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        cur.execute("""
-            INSERT INTO removed_nodes (id, name, building, type, floor, angle, can_report, geom, e_group_id)
-            SELECT id, name, building, type, floor, angle, can_report, geom, e_group_id
-            FROM nodes
-            WHERE id = ANY(%s)
-        """, (group_nodes,))
+    apply_closure(delta)
+    return jsonify({"success": True, "node": dict(node, in_use=True)})
 
-        cur.execute("""
-            INSERT INTO removed_edges (id, source, target, cost, geom)
-            SELECT id, source, target, cost, geom
-            FROM edges
-            WHERE source = ANY(%s) OR target = ANY(%s)
-        """, (group_nodes, group_nodes))
 
-        cur.execute("DELETE FROM nodes WHERE id = ANY(%s)", (group_nodes,))
+# closes many nodes at once, by id, e_group_id or whole building, and returns the graph delta
+@app.route("/admin/close-nodes", methods=["POST"])
+@admin_required
+def close_nodes():
+    data = request.json or {}
+    try:
+        delta = closures.close_nodes(
+            get_conn(),
+            node_ids=data.get("node_ids", []),
+            e_group_ids=data.get("e_group_ids", []),
+            buildings=data.get("buildings", []),
+            mode=app.config["CLOSURE_MODE"]
+        )
+    except Exception as e:
+        print("CLOSE NODES ERROR:", e)
+        return jsonify({"error": str(e)}), 500
 
-        cur.execute("""
-            DELETE FROM edges
-            WHERE source = ANY(%s) OR target = ANY(%s)
-        """, (group_nodes, group_nodes))
+    if delta["closed_nodes"]:
+        apply_closure(delta)
+    return jsonify({"success": True, "delta": delta})
 
-        map_conn.commit()
 
-        cur.execute("""
-            SELECT id, name, building, type, floor, angle, can_report,
-                   ST_X(geom) AS lat, ST_Y(geom) AS lng, e_group_id
-            FROM removed_nodes
-            WHERE id = %s
-        """, (node_id,))
-
-        node_row = cur.fetchone()
-
-        node_data = {
-            "id": node_row[0],
-            "name": node_row[1],
-            "building": node_row[2],
-            "type": node_row[3],
-            "lat": node_row[7],
-            "lng": node_row[8]
-        }
+# reopens many removed nodes at once and returns the graph delta
+@app.route("/admin/reopen-nodes", methods=["POST"])
+@admin_required
+def reopen_nodes():
+    data = request.json or {}
+    try:
+        delta = closures.reopen_nodes(
+            get_conn(),
+            node_ids=data.get("node_ids", []),
+            e_group_ids=data.get("e_group_ids", []),
+            buildings=data.get("buildings", []),
+            mode=app.config["CLOSURE_MODE"]
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    if delta["opened_nodes"]:
+        apply_closure(delta)
+    return jsonify({"success": True, "delta": delta})
 
+
+# schedules a closure window ahead of time, e.g. for planned elevator maintenance; routes
+# requested while the window is open leave the nodes out without anyone pressing remove/restore
+@app.route("/admin/schedule-closure", methods=["POST"])
+@admin_required
+def schedule_closure():
+    data = request.json or {}
+    if not data.get("starts_at") or not data.get("ends_at"):
+        return jsonify({"error": "starts_at and ends_at are required"}), 400
+    try:
+        scheduled = closures.schedule_closure(
+            get_conn(),
+            data["starts_at"],
+            data["ends_at"],
+            node_ids=data.get("node_ids", []),
+            e_group_ids=data.get("e_group_ids", []),
+            buildings=data.get("buildings", []),
+            description=data.get("description"),
+            report_id=data.get("report_id"),
+            created_by=session.get("user_id")
+        )
     except Exception as e:
-        print("REMOVE NODE ERROR:", e)
-        map_conn.rollback()
-        cur.close()
+        print("SCHEDULE CLOSURE ERROR:", e)
         return jsonify({"error": str(e)}), 500
 
+    # cached routes are keyed by window, so only the index needs rebuilding
+    closure_schedule.invalidate_schedule()
+    return jsonify({"success": True, "scheduled": scheduled})
+
+
+# closure windows that have not ended yet
+@app.route("/admin/scheduled-closures")
+@admin_required
+def scheduled_closures():
+    cur = get_conn().cursor()
+    cur.execute("""
+        SELECT s.id, s.node_id, n.name, n.building, s.starts_at, s.ends_at, s.description
+        FROM scheduled_closures s
+        LEFT JOIN (
+            SELECT id, name, building FROM nodes
+            UNION ALL
+            SELECT id, name, building FROM removed_nodes
+        ) n ON n.id = s.node_id
+        WHERE s.ends_at > now()
+        ORDER BY s.starts_at, s.id
+    """)
+    rows = cur.fetchall()
     cur.close()
-    return jsonify({"success": True, "node": node_data})
 
+    window_key, closed, next_boundary = current_window()
+    return jsonify({
+        "closures": [
+            {
+                "id": r[0], "node_id": r[1], "node_name": r[2], "building": r[3],
+                "starts_at": r[4].isoformat(), "ends_at": r[5].isoformat(), "description": r[6],
+                "active": r[1] in closed
+            }
+            for r in rows
+        ],
+        "window": window_key,
+        "next_change": next_boundary.isoformat() if next_boundary else None
+    })
 
-# moves node/edges back to main nodes and edges table
-@app.route("/admin/restore-node/<int:node_id>", methods=["POST"])
+
+# cancels a scheduled closure window
+@app.route("/admin/scheduled-closure/<int:closure_id>", methods=["DELETE"])
 @admin_required
-def restore_node(node_id):
-    cur = map_conn.cursor()
+def delete_scheduled_closure(closure_id):
+    cur = get_conn().cursor()
     try:
-        cur.execute("SELECT e_group_id FROM removed_nodes WHERE id = %s", (node_id,))
-        row = cur.fetchone()
+        cur.execute("DELETE FROM scheduled_closures WHERE id = %s", (closure_id,))
+        deleted = cur.rowcount
+        if deleted:
+            graph_changes.record(cur, "schedule")
+        get_conn().commit()
+    except Exception as e:
+        get_conn().rollback()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        cur.close()
 
-        if not row:
-            raise Exception("Node not found in removed_nodes")
+    if not deleted:
+        return jsonify({"error": "Scheduled closure not found"}), 404
+    closure_schedule.invalidate_schedule()
+    return jsonify({"success": True})
 
-        e_group_id = row[0]
 
-        if e_group_id is None:
-            group_nodes = [node_id]
+# reload the routing graph after the tables changed outside the app, e.g. after graph_import.py
+@app.route("/admin/reload-graph", methods=["POST"])
+@admin_required
+def reload_graph():
+    # every worker reloads when it reads the entry, this one included
+    version = graph_changes.record_change(get_conn(), "reload")
+    if version is None or not sync_graph_changes():
+        reset_graph_state()
+    return jsonify({"success": True, "graph_version": routing.graph_version()})
 
-        else:
-            cur.execute("SELECT id FROM removed_nodes WHERE e_group_id = %s", (e_group_id,))
-            group_nodes = [r[0] for r in cur.fetchall()]
 
-        cur.execute("""
-            INSERT INTO nodes (id, name, building, type, floor, angle, can_report, geom, e_group_id)
-            SELECT id, name, building, type, floor, angle, can_report, geom, e_group_id
-            FROM removed_nodes
-            WHERE id = ANY(%s)
-        """, (group_nodes,))
+# checkout and wait-time metrics for the connection pool
+@app.route("/admin/db-pool-stats")
+@admin_required
+def db_pool_stats():
+    return jsonify(db_pool.stats())
 
-        cur.execute("""
-            INSERT INTO edges (id, source, target, cost, geom)
-            SELECT id, source, target, cost, geom
-            FROM removed_edges
-            WHERE source = ANY(%s) OR target = ANY(%s)
-        """, (group_nodes, group_nodes))
 
-        cur.execute("DELETE FROM removed_nodes WHERE id = ANY(%s)", (group_nodes,))
+# waiting, written, duplicate and rejected report counts
+@app.route("/admin/report-queue-stats")
+@admin_required
+def report_queue_stats():
+    return jsonify(report_queue.stats())
 
-        cur.execute("""
-            DELETE FROM removed_edges
-            WHERE source = ANY(%s) OR target = ANY(%s)
-        """, (group_nodes, group_nodes))
 
-        cur.execute("""
-            DELETE FROM reports
-            WHERE node_id = ANY(%s)
-        """, (group_nodes,))
+# open /events streams and events dropped for slow clients
+@app.route("/admin/event-stats")
+@admin_required
+def event_stats():
+    return jsonify(broadcaster.stats())
 
-        map_conn.commit()
 
-        cur.execute("""
-            SELECT id, name, building, type, floor, angle, can_report,
-                   ST_X(geom) AS lat, ST_Y(geom) AS lng, e_group_id
-            FROM nodes
-            WHERE id = %s
-        """, (node_id,))
-
-        node_row = cur.fetchone()
-
-        node_data = {
-            "id": node_row[0],
-            "name": node_row[1],
-            "building": node_row[2],
-            "type": node_row[3],
-            "lat": node_row[7],
-            "lng": node_row[8],
-            "in_use": True
-        }
+# hit/miss counters for the route cache
+@app.route("/admin/route-cache-stats")
+@admin_required
+def route_cache_stats():
+    stats = route_cache.stats()
+    stats["graph_version"] = routing.graph_version()
+    stats["graph_snapshot"] = routing.snapshot_info()
+    stats["landmarks"] = routing.landmark_info()
+    stats["closure_window"] = current_window()[0]
+    stats["executor"] = route_executor.stats()
+    return jsonify(stats)
+
+
+# the queries and row shapes below are shared with the async endpoints in asgi.py
+STARRED_ROUTES_QUERY = """
+    SELECT id, custom_name, created_at
+    FROM starred_routes
+    WHERE user_id = %s
+    ORDER BY created_at DESC
+"""
+
+STARRED_ROUTE_QUERY = """
+    SELECT route_json, directions
+    FROM starred_routes
+    WHERE id = %s AND user_id = %s
+"""
+
+DELETE_STARRED_ROUTE_QUERY = """
+    DELETE FROM starred_routes
+    WHERE id = %s AND user_id = %s
+"""
+
+ALERTS_SINCE_QUERY = """
+    SELECT id, user_id, alert_text, created_at
+    FROM alerts
+    WHERE id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+ALERTS_BEFORE_QUERY = """
+    SELECT id, user_id, alert_text, created_at
+    FROM alerts
+    WHERE %s::integer IS NULL OR id < %s
+    ORDER BY id DESC
+    LIMIT %s
+"""
+
+CREATE_ALERT_QUERY = """
+    INSERT INTO alerts (user_id, alert_text)
+    VALUES (%s, %s)
+    RETURNING id, created_at
+"""
+
+UPDATE_SETTINGS_QUERY = """
+    UPDATE users
+    SET mode = %s,
+        live_updates = %s,
+        voice_over = %s
+    WHERE user_id = %s
+"""
+
+
+def starred_route_json(row):
+    return {
+        "id": row[0],
+        "custom_name": row[1],
+        "created_at": row[2].isoformat()
+    }
+
+
+def starred_route_detail_json(row):
+    route_json, directions = row
+    if isinstance(route_json, str):
+        route_json = json.loads(route_json)
+    if isinstance(directions, str):
+        directions = json.loads(directions)
+    return {
+        "route_json": route_json,
+        "directions": directions
+    }
 
-    except Exception as e:
-        map_conn.rollback()
-        cur.close()
-        return jsonify({"error": str(e)}), 500
 
-    cur.close()
-    return jsonify({"success": True, "node": node_data})
+def alert_json(row):
+    return {
+        "id": row[0],
+        "user_id": row[1],
+        "alert_text": row[2],
+        "created_at": row[3].isoformat()
+    }
+
+
+# limit, since and before of an /alerts request
+def alerts_page_args(args):
+    limit = max(1, min(args.get("limit", app.config["ALERTS_PAGE_SIZE"], type=int), 500))
+    return limit, args.get("since", type=int), args.get("before", type=int)
 
 
 # returns list of starred routes
@@ -701,25 +1546,12 @@ def get_starred_routes():
     if not user_id:
         return jsonify([])
 
-    cur = map_conn.cursor()
-    cur.execute("""
-        SELECT id, custom_name, created_at
-        FROM starred_routes
-        WHERE user_id = %s
-        ORDER BY created_at DESC
-    """, (user_id,))
+    cur = get_conn().cursor()
+    cur.execute(STARRED_ROUTES_QUERY, (user_id,))
     rows = cur.fetchall()
     cur.close()
 
-    result = []
-    for r in rows:
-        result.append({
-            "id": r[0],
-            "custom_name": r[1],
-            "created_at": r[2].isoformat()
-        })
-
-    return jsonify(result)
+    return jsonify([starred_route_json(r) for r in rows])
 
 
 # returns geometry of a starred route
@@ -729,12 +1561,8 @@ def get_starred_route(route_id):
     if not user_id:
         return jsonify({"error": "Not logged in"}), 403
 
-    cur = map_conn.cursor()
-    cur.execute("""
-        SELECT route_json, directions
-        FROM starred_routes
-        WHERE id = %s AND user_id = %s
-    """, (route_id, user_id))
+    cur = get_conn().cursor()
+    cur.execute(STARRED_ROUTE_QUERY, (route_id, user_id))
 
     row = cur.fetchone()
     cur.close()
@@ -742,17 +1570,7 @@ def get_starred_route(route_id):
     if not row:
         return jsonify({"error": "Route not found"}), 404
 
-    route_json, directions = row
-
-    if isinstance(route_json, str):
-        route_json = json.loads(route_json)
-    if isinstance(directions, str):
-        directions = json.loads(directions)
-
-    return jsonify({
-        "route_json": route_json,
-        "directions": directions
-    })
+    return jsonify(starred_route_detail_json(row))
 
 
 # deletes a starred route
@@ -768,21 +1586,18 @@ def delete_starred_route():
     if not route_id:
         return jsonify({"error": "Missing route id"}), 400
 
-    cur = map_conn.cursor()
+    cur = get_conn().cursor()
     try:
-        cur.execute("""
-            DELETE FROM starred_routes
-            WHERE id = %s AND user_id = %s
-        """, (route_id, user_id))
+        cur.execute(DELETE_STARRED_ROUTE_QUERY, (route_id, user_id))
 
         if cur.rowcount == 0:
-            map_conn.rollback()
+            get_conn().rollback()
             return jsonify({"error": "Route not found"}), 404
 
-        map_conn.commit()
+        get_conn().commit()
 
     except Exception as e:
-        map_conn.rollback()
+        get_conn().rollback()
         print("Error deleting starred route:", e)
         return jsonify({"error": str(e)}), 500
     finally:
@@ -798,26 +1613,37 @@ def get_alerts():
     if not user_id:
         return jsonify({"error": "Not logged in"}), 403
 
-    cur = map_conn.cursor()
-    cur.execute("""
-        SELECT id, user_id, alert_text, created_at
-        FROM alerts
-        ORDER BY created_at DESC
-    """)
+    # ?since=<id> pages forward through newer alerts (oldest first) to catch up after a
+    # disconnect, ?before=<id> pages back through older ones, neither gives the newest page
+    limit, since, before = alerts_page_args(request.args)
+
+    cur = get_conn().cursor()
+    if since is not None:
+        cur.execute(ALERTS_SINCE_QUERY, (since, limit))
+    else:
+        cur.execute(ALERTS_BEFORE_QUERY, (before, before, limit))
     rows = cur.fetchall()
     cur.close()
 
-    alerts = [
-        {
-            "id": row[0],
-            "user_id": row[1],
-            "alert_text": row[2],
-            "created_at": row[3].isoformat()
-        }
-        for row in rows
-    ]
+    response = jsonify([alert_json(row) for row in rows])
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1][0])
+    return response
 
-    return jsonify(alerts)
+
+# stream of alert and closure events for the open map, so nobody has to poll or reload
+@app.route("/events")
+def event_stream():
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+    q = broadcaster.subscribe(last_event_id)
+    response = Response(
+        broadcaster.stream(q, keepalive=app.config["EVENTS_KEEPALIVE"]),
+        mimetype="text/event-stream"
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    # stop nginx from buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 
 # add alert to alerts table
@@ -833,19 +1659,20 @@ def create_alert():
     if not alert_text or not alert_text.strip():
         return jsonify({"error": "Missing alert text"}), 400
 
-    cur = map_conn.cursor()
+    cur = get_conn().cursor()
     try:
-        cur.execute("""
-            INSERT INTO alerts (user_id, alert_text)
-            VALUES (%s, %s)
-        """, (user_id, alert_text.strip()))
-        map_conn.commit()
+        cur.execute(CREATE_ALERT_QUERY, (user_id, alert_text.strip()))
+        alert_id, created_at = cur.fetchone()
+        alert = alert_json((alert_id, user_id, alert_text.strip(), created_at))
+        version = graph_changes.record(cur, "alert", alert)
+        get_conn().commit()
     except Exception as e:
-        map_conn.rollback()
+        get_conn().rollback()
         return jsonify({"error": str(e)}), 500
     finally:
         cur.close()
 
+    publish_event("alert", alert, version)
     return jsonify({"success": True})
 
 
@@ -859,18 +1686,20 @@ def delete_alert(alert_id):
     if not session.get("is_admin"):
         return jsonify({"error": "Not authorized"}), 403
 
-    cur = map_conn.cursor()
+    cur = get_conn().cursor()
     try:
         cur.execute("DELETE FROM alerts WHERE id = %s", (alert_id,))
         if cur.rowcount == 0:
             return jsonify({"error": "Alert not found"}), 404
-        map_conn.commit()
+        version = graph_changes.record(cur, "alert-deleted", {"id": alert_id})
+        get_conn().commit()
     except Exception as e:
-        map_conn.rollback()
+        get_conn().rollback()
         return jsonify({"error": str(e)}), 500
     finally:
         cur.close()
 
+    publish_event("alert-deleted", {"id": alert_id}, version)
     return jsonify({"success": True})
 
 
@@ -889,18 +1718,12 @@ def update_settings():
     if mode not in ("light", "dark"):
         return jsonify({"error": "Invalid mode"}), 400
 
-    cur = map_conn.cursor()
+    cur = get_conn().cursor()
     try:
-        cur.execute("""
-            UPDATE users
-            SET mode = %s,
-                live_updates = %s,
-                voice_over = %s
-            WHERE user_id = %s
-        """, (mode, live_updates, voice_over, user_id))
-        map_conn.commit()
+        cur.execute(UPDATE_SETTINGS_QUERY, (mode, live_updates, voice_over, user_id))
+        get_conn().commit()
     except Exception as e:
-        map_conn.rollback()
+        get_conn().rollback()
         return jsonify({"error": str(e)}), 500
     finally:
         cur.close()
@@ -908,5 +1731,12 @@ def update_settings():
     return jsonify({"success": True})
 
 
+start_graph_sync()
+
+if app.config["PRECOMPUTE_ROUTES"]:
+    route_table = RouteTable(build_route_set_background, routing.graph_version, app.config["ROUTE_TABLE_PATH"])
+    start_route_table()
+
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,188 @@
+# async deployment: `uvicorn asgi:application` (or hypercorn) from pages/.
+# the I/O-bound endpoints below run natively async on quart with a psycopg 3 async pool, so an open
+# /events stream or a request waiting on postgres holds a coroutine instead of a thread. every other
+# route is the unchanged flask app behind asgiref's WSGI adapter. queries, response shapes and the
+# event broadcaster are shared with app.py
+import asyncio
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+from quart import Quart, Response, jsonify, redirect, request, session
+
+import app as sync_app
+from app import app as flask_app, broadcaster
+
+quart_app = Quart(__name__, static_folder=None)
+# same secret key, so both halves read the session cookie the flask login set
+quart_app.secret_key = flask_app.secret_key
+quart_app.config["ASYNC_DB_POOL_MIN"] = int(os.environ.get("ASYNC_DB_POOL_MIN", 2))
+quart_app.config["ASYNC_DB_POOL_MAX"] = int(os.environ.get("ASYNC_DB_POOL_MAX", 20))
+
+db_pool = AsyncConnectionPool(
+    make_conninfo(**sync_app.DB_SETTINGS),
+    min_size=quart_app.config["ASYNC_DB_POOL_MIN"],
+    max_size=quart_app.config["ASYNC_DB_POOL_MAX"],
+    open=False
+)
+
+
+@quart_app.before_serving
+async def open_pool():
+    await db_pool.open()
+
+
+@quart_app.after_serving
+async def close_pool():
+    await db_pool.close()
+
+
+# same rule as app.require_login, none of these endpoints are public
+@quart_app.before_request
+async def require_login():
+    if "user_id" not in session:
+        return redirect("/")
+
+
+# rows of a read-only query
+async def fetch(query, params):
+    async with db_pool.connection() as conn:
+        cur = await conn.execute(query, params)
+        return await cur.fetchall()
+
+
+# run a write and commit it, returns (rowcount, first returned row or None)
+async def execute(query, params):
+    async with db_pool.connection() as conn:
+        cur = await conn.execute(query, params)
+        row = await cur.fetchone() if cur.description else None
+        return cur.rowcount, row
+
+
+@quart_app.route("/alerts", methods=["GET"])
+async def get_alerts():
+    limit, since, before = sync_app.alerts_page_args(request.args)
+    if since is not None:
+        rows = await fetch(sync_app.ALERTS_SINCE_QUERY, (since, limit))
+    else:
+        rows = await fetch(sync_app.ALERTS_BEFORE_QUERY, (before, before, limit))
+
+    response = jsonify([sync_app.alert_json(row) for row in rows])
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1][0])
+    return response
+
+
+@quart_app.route("/events")
+async def event_stream():
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+    q = broadcaster.subscribe(last_event_id, loop=asyncio.get_running_loop())
+    response = Response(
+        broadcaster.stream_async(q, keepalive=flask_app.config["EVENTS_KEEPALIVE"]),
+        mimetype="text/event-stream"
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    # the stream stays open for as long as the map does
+    response.timeout = None
+    return response
+
+
+@quart_app.route("/create-alert", methods=["POST"])
+async def create_alert():
+    data = await request.get_json()
+    alert_text = data.get("alert_text")
+
+    if not alert_text or not alert_text.strip():
+        return jsonify({"error": "Missing alert text"}), 400
+
+    user_id = session["user_id"]
+    try:
+        _, (alert_id, created_at) = await execute(sync_app.CREATE_ALERT_QUERY, (user_id, alert_text.strip()))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    # through graph_changes so streams held by other worker processes get it too
+    alert = sync_app.alert_json((alert_id, user_id, alert_text.strip(), created_at))
+    await asyncio.to_thread(sync_app.share_event, "alert", alert)
+    return jsonify({"success": True})
+
+
+@quart_app.route("/delete-alert/<int:alert_id>", methods=["DELETE"])
+async def delete_alert(alert_id):
+    if not session.get("is_admin"):
+        return jsonify({"error": "Not authorized"}), 403
+
+    try:
+        deleted, _ = await execute("DELETE FROM alerts WHERE id = %s", (alert_id,))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    if deleted == 0:
+        return jsonify({"error": "Alert not found"}), 404
+
+    await asyncio.to_thread(sync_app.share_event, "alert-deleted", {"id": alert_id})
+    return jsonify({"success": True})
+
+
+@quart_app.route("/get-starred-routes")
+async def get_starred_routes():
+    rows = await fetch(sync_app.STARRED_ROUTES_QUERY, (session["user_id"],))
+    return jsonify([sync_app.starred_route_json(r) for r in rows])
+
+
+@quart_app.route("/get-starred-route/<int:route_id>")
+async def get_starred_route(route_id):
+    rows = await fetch(sync_app.STARRED_ROUTE_QUERY, (route_id, session["user_id"]))
+    if not rows:
+        return jsonify({"error": "Route not found"}), 404
+    return jsonify(sync_app.starred_route_detail_json(rows[0]))
+
+
+@quart_app.route("/delete_starred_route", methods=["POST"])
+async def delete_starred_route():
+    data = await request.get_json()
+    route_id = data.get("id")
+
+    if not route_id:
+        return jsonify({"error": "Missing route id"}), 400
+
+    try:
+        deleted, _ = await execute(sync_app.DELETE_STARRED_ROUTE_QUERY, (route_id, session["user_id"]))
+    except Exception as e:
+        print("Error deleting starred route:", e)
+        return jsonify({"error": str(e)}), 500
+    if deleted == 0:
+        return jsonify({"error": "Route not found"}), 404
+    return jsonify({"success": True})
+
+
+@quart_app.route("/update-settings", methods=["POST"])
+async def update_settings():
+    data = await request.get_json()
+    mode = data.get("mode")
+
+    if mode not in ("light", "dark"):
+        return jsonify({"error": "Invalid mode"}), 400
+
+    try:
+        await execute(
+            sync_app.UPDATE_SETTINGS_QUERY,
+            (mode, data.get("live_updates"), data.get("voice_over"), session["user_id"])
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"success": True})
+
+
+flask_asgi = WsgiToAsgi(flask_app)
+
+
+# send each request to the async route that matches it, everything else to flask
+async def application(scope, receive, send):
+    if scope["type"] == "http":
+        adapter = quart_app.url_map.bind("")
+        if not adapter.test(scope["path"], scope["method"]):
+            await flask_asgi(scope, receive, send)
+            return
+    await quart_app(scope, receive, send)
@@ -0,0 +1,127 @@
+# compare the route alternative generators on the in-process graph, for latency and route quality.
+#   python benchmark_alternatives.py                                     every building pair, from postgres
+#   python benchmark_alternatives.py --graphml static/UMBC_StreetMap.graphml --pairs 200
+#                                                                        random node pairs, no database
+# "ksp" is yen's k=10 plus the overlap filter, the same routes as the pgr_ksp query in app.py, and
+# "penalty" is RoutingGraph.alternative_routes. --sql also times the pgr_ksp query itself
+import argparse
+import json
+import random
+import statistics
+import time
+
+import psycopg2
+
+import routing
+from db import DB_SETTINGS
+
+
+def graphml_graph(path):
+    import graph_import
+
+    nodes, edges = graph_import.graph_rows(path)
+    node_rows = [(n[0], "walkway", None, None, None, n[1], n[2], True) for n in nodes]
+    edge_rows = []
+    for edge_id, source, target, cost, wkt, _, _ in edges:
+        points = [[float(v) for v in p.split()] for p in wkt[wkt.index("(") + 1:-1].split(",")]
+        edge_rows.append((edge_id, source, target, cost, json.dumps({"type": "LineString", "coordinates": points}), True))
+    return routing.RoutingGraph(node_rows, edge_rows)
+
+
+def share_on(edges, other):
+    return sum(1 for e in edges if e in other) / len(edges) if edges else 0.0
+
+
+def run(graph, pairs, method, count, max_overlap):
+    times = []
+    stretch = []
+    overlap = []
+    found = []
+    for start, end in pairs:
+        started = time.perf_counter()
+        routes = graph.find_routes(start, end, max_overlap=max_overlap, count=count, method=method)
+        times.append((time.perf_counter() - started) * 1000)
+        if not routes:
+            continue
+        found.append(len(routes))
+        shortest = min(routes, key=lambda r: r["cost"])
+        for route in routes:
+            if route is shortest:
+                continue
+            stretch.append(route["cost"] / shortest["cost"] if shortest["cost"] else 1.0)
+            overlap.append(share_on(route["edges"], set(shortest["edges"])))
+
+    times.sort()
+    return {
+        "method": method,
+        "pairs": len(pairs),
+        "median_ms": round(statistics.median(times), 3),
+        "p95_ms": round(times[int(len(times) * 0.95) - 1], 3),
+        "avg_routes": round(statistics.mean(found), 2) if found else 0,
+        "full_sets": f"{sum(1 for n in found if n >= count)}/{len(found)}",
+        "avg_stretch": round(statistics.mean(stretch), 3) if stretch else None,
+        "max_stretch": round(max(stretch), 3) if stretch else None,
+        "avg_overlap": round(statistics.mean(overlap), 3) if overlap else None
+    }
+
+
+def run_sql(conn, pairs, count, max_overlap):
+    # only needed here, importing app opens its connection pool
+    from app import ROUTES_QUERY
+
+    times = []
+    cur = conn.cursor()
+    for start, end in pairs:
+        started = time.perf_counter()
+        cur.execute(ROUTES_QUERY, ([], start, start, start, start, start, end, end, end, end, end, max_overlap, count))
+        cur.fetchall()
+        times.append((time.perf_counter() - started) * 1000)
+    cur.close()
+    times.sort()
+    return {
+        "method": "pgr_ksp query",
+        "pairs": len(pairs),
+        "median_ms": round(statistics.median(times), 3),
+        "p95_ms": round(times[int(len(times) * 0.95) - 1], 3)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark route alternative generators")
+    parser.add_argument("--graphml", help="build the graph from a GraphML file instead of postgres")
+    parser.add_argument("--pairs", type=int, default=200, help="random node pairs to route with --graphml")
+    parser.add_argument("--count", type=int, default=3)
+    parser.add_argument("--max-overlap", type=float, default=0.6)
+    parser.add_argument("--landmarks", type=int, default=0, help="ALT landmarks to build first")
+    parser.add_argument("--sql", action="store_true", help="also time the pgr_ksp query")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    conn = None
+    if args.graphml:
+        graph = graphml_graph(args.graphml)
+        rng = random.Random(args.seed)
+        ids = [int(i) for i in graph.node_ids[graph.offsets[1:] > graph.offsets[:-1]]]
+        pairs = [
+            (routing.NODE_PREFIX + str(a), routing.NODE_PREFIX + str(b))
+            for a, b in (rng.sample(ids, 2) for _ in range(args.pairs))
+        ]
+    else:
+        conn = psycopg2.connect(**DB_SETTINGS)
+        graph = routing.load_graph(conn)
+        buildings = sorted(b for b in graph.building_nodes if b)
+        pairs = [(s, e) for s in buildings for e in buildings if s != e]
+
+    if args.landmarks:
+        customizing = graph.build_landmarks(args.landmarks)
+        if customizing is not None:
+            customizing.join()
+
+    results = [run(graph, pairs, method, args.count, args.max_overlap) for method in ("ksp", "penalty")]
+    if args.sql and conn is not None:
+        results.append(run_sql(conn, pairs, args.count, args.max_overlap))
+    if conn is not None:
+        conn.close()
+
+    for result in results:
+        print(json.dumps(result))
@@ -0,0 +1,94 @@
+import bisect
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+from psycopg2 import errors
+
+
+# interval index over scheduled closures: every window start and end, sorted, with the set of
+# nodes closed between each boundary and the next worked out once when the schedule is loaded
+class ClosureSchedule:
+    def __init__(self, rows):
+        events = {}
+        for node_id, starts_at, ends_at in rows:
+            if ends_at <= starts_at:
+                continue
+            events.setdefault(starts_at, []).append((node_id, 1))
+            events.setdefault(ends_at, []).append((node_id, -1))
+
+        self.boundaries = sorted(events)
+        self.spans = []
+        self.keys = []
+        # overlapping windows on the same node are counted so the node only reopens after the last one
+        active = {}
+        for boundary in self.boundaries:
+            for node_id, step in events[boundary]:
+                count = active.get(node_id, 0) + step
+                if count:
+                    active[node_id] = count
+                else:
+                    active.pop(node_id, None)
+            closed = frozenset(active)
+            self.spans.append(closed)
+            self.keys.append(window_key(closed))
+
+    # (key, closed node ids, next boundary or None) for the window containing this moment
+    def window(self, now=None):
+        now = now or datetime.now(timezone.utc)
+        i = bisect.bisect_right(self.boundaries, now)
+        next_boundary = self.boundaries[i] if i < len(self.boundaries) else None
+        if i == 0:
+            return "", frozenset(), next_boundary
+        return self.keys[i - 1], self.spans[i - 1], next_boundary
+
+
+# windows that close the same nodes share a key, so cached routes carry over between them
+def window_key(closed):
+    if not closed:
+        return ""
+    ids = ",".join(str(n) for n in sorted(closed))
+    return hashlib.sha256(ids.encode("utf-8")).hexdigest()[:12]
+
+
+# read the closures that have not ended yet
+def load_schedule(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT node_id, starts_at, ends_at
+            FROM scheduled_closures
+            WHERE ends_at > now()
+        """)
+        rows = cur.fetchall()
+    except errors.UndefinedTable:
+        conn.rollback()
+        print("scheduled_closures table missing, run sql/scheduled_closures.sql to enable it")
+        rows = []
+    finally:
+        cur.close()
+    return ClosureSchedule(rows)
+
+
+_schedule = None
+_schedule_lock = threading.Lock()
+
+
+# the shared schedule if it is already loaded, None otherwise
+def loaded_schedule():
+    return _schedule
+
+
+# shared schedule, loaded once and reused until closures are added or removed
+def get_schedule(conn):
+    global _schedule
+    with _schedule_lock:
+        if _schedule is None:
+            _schedule = load_schedule(conn)
+        return _schedule
+
+
+def invalidate_schedule():
+    global _schedule
+    with _schedule_lock:
+        _schedule = None
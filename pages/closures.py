@@ -0,0 +1,278 @@
+# bulk accessibility closures, applied in one statement and described as a graph delta.
+# "move" mode moves nodes (and their e_group_id siblings) with their edges between nodes/edges and
+# removed_nodes/removed_edges. "flag" mode runs on the schema from sql/soft_closures.sql and only
+# sets or clears a bit in graph_nodes.closed_mask. every change is added to the shared
+# graph_changes log in the same transaction, so other worker processes pick it up
+import graph_changes
+
+# closed_mask bit set by admin closures
+CLOSED_BY_ADMIN = 1
+
+# nodes picked by id, by e_group_id, or by building, always widened to whole e_group_id groups.
+# sql/closure_indexes.sql adds the indexes these lookups and the edge deletes below rely on
+SELECT_TARGETS = """
+    picked AS (
+        SELECT id, e_group_id
+        FROM {table}
+        WHERE id = ANY(%(node_ids)s::bigint[])
+           OR e_group_id = ANY(%(e_group_ids)s)
+           OR building = ANY(%(buildings)s::text[])
+    ),
+    targets AS (
+        SELECT id FROM picked
+        UNION
+        SELECT t.id
+        FROM {table} t
+        JOIN picked p ON t.e_group_id = p.e_group_id
+    )
+"""
+
+CLOSE_QUERY = "WITH" + SELECT_TARGETS.format(table="nodes") + """,
+    moved_nodes AS (
+        DELETE FROM nodes
+        WHERE id IN (SELECT id FROM targets)
+        RETURNING id, name, building, type, floor, angle, can_report, geom, e_group_id
+    ),
+    moved_edges AS (
+        -- two single-column lookups instead of source = ANY(...) OR target = ANY(...),
+        -- so each side can use its own index
+        DELETE FROM edges
+        WHERE id IN (
+            SELECT id FROM edges WHERE source IN (SELECT id FROM targets)
+            UNION
+            SELECT id FROM edges WHERE target IN (SELECT id FROM targets)
+        )
+        RETURNING id, source, target, cost, geom
+    ),
+    saved_nodes AS (
+        INSERT INTO removed_nodes (id, name, building, type, floor, angle, can_report, geom, e_group_id)
+        SELECT id, name, building, type, floor, angle, can_report, geom, e_group_id
+        FROM moved_nodes
+    ),
+    saved_edges AS (
+        INSERT INTO removed_edges (id, source, target, cost, geom)
+        SELECT id, source, target, cost, geom
+        FROM moved_edges
+    )
+    SELECT 'node', id, name, building, type, ST_X(geom), ST_Y(geom), NULL::bigint, NULL::bigint
+    FROM moved_nodes
+    UNION ALL
+    SELECT 'edge', id, NULL, NULL, NULL, NULL, NULL, source, target
+    FROM moved_edges
+"""
+
+REOPEN_QUERY = "WITH" + SELECT_TARGETS.format(table="removed_nodes") + """,
+    moved_nodes AS (
+        DELETE FROM removed_nodes
+        WHERE id IN (SELECT id FROM targets)
+        RETURNING id, name, building, type, floor, angle, can_report, geom, e_group_id
+    ),
+    still_closed AS (
+        SELECT id FROM removed_nodes WHERE id NOT IN (SELECT id FROM targets)
+    ),
+    moved_edges AS (
+        -- an edge only comes back once neither end is still closed
+        DELETE FROM removed_edges
+        WHERE id IN (
+            SELECT id FROM removed_edges WHERE source IN (SELECT id FROM targets)
+            UNION
+            SELECT id FROM removed_edges WHERE target IN (SELECT id FROM targets)
+        )
+        AND source NOT IN (SELECT id FROM still_closed)
+        AND target NOT IN (SELECT id FROM still_closed)
+        RETURNING id, source, target, cost, geom
+    ),
+    saved_nodes AS (
+        INSERT INTO nodes (id, name, building, type, floor, angle, can_report, geom, e_group_id)
+        SELECT id, name, building, type, floor, angle, can_report, geom, e_group_id
+        FROM moved_nodes
+    ),
+    saved_edges AS (
+        INSERT INTO edges (id, source, target, cost, geom)
+        SELECT id, source, target, cost, geom
+        FROM moved_edges
+    ),
+    cleared_reports AS (
+        DELETE FROM reports
+        WHERE node_id IN (SELECT id FROM moved_nodes)
+    )
+    SELECT 'node', id, name, building, type, ST_X(geom), ST_Y(geom), NULL::bigint, NULL::bigint
+    FROM moved_nodes
+    UNION ALL
+    SELECT 'edge', id, NULL, NULL, NULL, NULL, NULL, source, target
+    FROM moved_edges
+"""
+
+
+FLAG_CLOSE_QUERY = "WITH" + SELECT_TARGETS.format(table="graph_nodes") + """,
+    changed AS (
+        UPDATE graph_nodes g
+        SET closed_mask = old.closed_mask | %(reason)s
+        FROM graph_nodes old
+        WHERE g.id = old.id
+          AND g.id IN (SELECT id FROM targets)
+          AND (old.closed_mask & %(reason)s) = 0
+        RETURNING g.id, g.name, g.building, g.type, g.geom, old.closed_mask AS old_mask
+    ),
+    newly_closed AS (
+        SELECT * FROM changed WHERE old_mask = 0
+    ),
+    closed_edges AS (
+        -- edges that were routable until one of their ends closed
+        SELECT e.id, e.source, e.target
+        FROM graph_edges e
+        JOIN graph_nodes s ON s.id = e.source
+        JOIN graph_nodes t ON t.id = e.target
+        WHERE e.closed_mask = 0 AND s.closed_mask = 0 AND t.closed_mask = 0
+          AND e.id IN (
+              SELECT id FROM graph_edges WHERE source IN (SELECT id FROM newly_closed)
+              UNION
+              SELECT id FROM graph_edges WHERE target IN (SELECT id FROM newly_closed)
+          )
+    )
+    SELECT 'node', id, name, building, type, ST_X(geom), ST_Y(geom), NULL::bigint, NULL::bigint
+    FROM newly_closed
+    UNION ALL
+    SELECT 'edge', id, NULL, NULL, NULL, NULL, NULL, source, target
+    FROM closed_edges
+"""
+
+FLAG_REOPEN_QUERY = "WITH" + SELECT_TARGETS.format(table="graph_nodes") + """,
+    changed AS (
+        UPDATE graph_nodes g
+        SET closed_mask = old.closed_mask & ~%(reason)s
+        FROM graph_nodes old
+        WHERE g.id = old.id
+          AND g.id IN (SELECT id FROM targets)
+          AND (old.closed_mask & %(reason)s) <> 0
+        RETURNING g.id, g.name, g.building, g.type, g.geom, g.closed_mask AS new_mask
+    ),
+    newly_open AS (
+        SELECT * FROM changed WHERE new_mask = 0
+    ),
+    opened_edges AS (
+        -- edges whose ends are now both open, judged on the post-update masks
+        SELECT e.id, e.source, e.target
+        FROM graph_edges e
+        JOIN graph_nodes s ON s.id = e.source
+        JOIN graph_nodes t ON t.id = e.target
+        LEFT JOIN changed cs ON cs.id = e.source
+        LEFT JOIN changed ct ON ct.id = e.target
+        WHERE e.closed_mask = 0
+          AND COALESCE(cs.new_mask, s.closed_mask) = 0
+          AND COALESCE(ct.new_mask, t.closed_mask) = 0
+          AND e.id IN (
+              SELECT id FROM graph_edges WHERE source IN (SELECT id FROM newly_open)
+              UNION
+              SELECT id FROM graph_edges WHERE target IN (SELECT id FROM newly_open)
+          )
+    ),
+    cleared_reports AS (
+        DELETE FROM reports
+        WHERE node_id IN (SELECT id FROM changed)
+    )
+    SELECT 'node', id, name, building, type, ST_X(geom), ST_Y(geom), NULL::bigint, NULL::bigint
+    FROM newly_open
+    UNION ALL
+    SELECT 'edge', id, NULL, NULL, NULL, NULL, NULL, source, target
+    FROM opened_edges
+"""
+
+
+# e_group_ids as an untyped array literal, which postgres reads as an array of the column's own
+# type, so the comparison can use an index on e_group_id whatever type the column has
+def _array_literal(values):
+    quoted = ('"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for v in values)
+    return "{" + ",".join(quoted) + "}"
+
+
+def _run(conn, query, node_ids, e_group_ids, buildings, reason, make_delta):
+    params = {
+        "node_ids": [int(n) for n in node_ids],
+        "e_group_ids": _array_literal(e_group_ids),
+        "buildings": list(buildings),
+        "reason": reason
+    }
+    cur = conn.cursor()
+    try:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+
+        nodes = [
+            {"id": r[1], "name": r[2], "building": r[3], "type": r[4], "lng": r[5], "lat": r[6]}
+            for r in rows if r[0] == "node"
+        ]
+        edges = [{"id": r[1], "source": r[7], "target": r[8]} for r in rows if r[0] == "edge"]
+        delta = make_delta(nodes, edges)
+        # None when nothing changed or the log table is missing
+        version = graph_changes.record(cur, "closure", delta) if nodes else None
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    return dict(delta, version=version)
+
+
+# close every selected node and its incident edges in one transaction, returns the graph delta
+def close_nodes(conn, node_ids=(), e_group_ids=(), buildings=(), mode="move", reason=CLOSED_BY_ADMIN):
+    query = FLAG_CLOSE_QUERY if mode == "flag" else CLOSE_QUERY
+    return _run(conn, query, node_ids, e_group_ids, buildings, reason, lambda nodes, edges: {
+        "closed_nodes": nodes, "closed_edges": edges, "opened_nodes": [], "opened_edges": []
+    })
+
+
+# reopen selected removed nodes and every edge whose ends are both open again, returns the graph delta
+def reopen_nodes(conn, node_ids=(), e_group_ids=(), buildings=(), mode="move", reason=CLOSED_BY_ADMIN):
+    query = FLAG_REOPEN_QUERY if mode == "flag" else REOPEN_QUERY
+    return _run(conn, query, node_ids, e_group_ids, buildings, reason, lambda nodes, edges: {
+        "closed_nodes": [], "closed_edges": [], "opened_nodes": nodes, "opened_edges": edges
+    })
+
+
+SCHEDULE_QUERY = """
+    WITH all_nodes AS (
+        SELECT id, e_group_id, building FROM nodes
+        UNION ALL
+        SELECT id, e_group_id, building FROM removed_nodes
+    ),""" + SELECT_TARGETS.format(table="all_nodes") + """
+    INSERT INTO scheduled_closures (node_id, starts_at, ends_at, description, report_id, created_by)
+    SELECT id, %(starts_at)s::timestamptz, %(ends_at)s::timestamptz, %(description)s, %(report_id)s, %(created_by)s
+    FROM targets
+    RETURNING id, node_id, starts_at, ends_at
+"""
+
+
+# schedule a closure window for every selected node (widened to e_group_id groups like the others),
+# returns the scheduled_closures rows it created
+def schedule_closure(conn, starts_at, ends_at, node_ids=(), e_group_ids=(), buildings=(),
+                     description=None, report_id=None, created_by=None):
+    params = {
+        "node_ids": [int(n) for n in node_ids],
+        "e_group_ids": _array_literal(e_group_ids),
+        "buildings": list(buildings),
+        "starts_at": starts_at,
+        "ends_at": ends_at,
+        "description": description[:255] if description else None,
+        "report_id": report_id,
+        "created_by": created_by
+    }
+    cur = conn.cursor()
+    try:
+        cur.execute(SCHEDULE_QUERY, params)
+        rows = cur.fetchall()
+        if rows:
+            graph_changes.record(cur, "schedule")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    return [
+        {"id": r[0], "node_id": r[1], "starts_at": r[2].isoformat(), "ends_at": r[3].isoformat()}
+        for r in rows
+    ]
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from psycopg2 import extensions
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+# connection settings for the app's pools and the import scripts
+DB_SETTINGS = {
+    "host": "localhost",
+    "dbname": "map_db",
+    "user": "postgres",
+    "password": "thebestpassword",
+    "port": "5432"
+}
+
+
+# ThreadedConnectionPool that waits for a free connection instead of failing, and keeps wait-time metrics
+class ConnectionPool:
+    def __init__(self, minconn, maxconn, timeout=10, **conn_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **conn_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.in_use = 0
+        self.timeouts = 0
+        self.rollbacks = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def getconn(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise PoolError(f"no database connection available after {self.timeout}s")
+
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        return conn
+
+    # anything left uncommitted, failed or not, is rolled back so the next user gets a clean connection.
+    # only failed transactions count as rollbacks, an open read is just a request that never committed
+    def putconn(self, conn):
+        close = bool(conn.closed)
+        if not close:
+            status = conn.get_transaction_status()
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                    if status == extensions.TRANSACTION_STATUS_INERROR:
+                        with self._lock:
+                            self.rollbacks += 1
+                except Exception:
+                    close = True
+
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "in_use": self.in_use,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "rollbacks": self.rollbacks,
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0,
+                "max_wait_ms": round(self.max_wait * 1000, 3)
+            }
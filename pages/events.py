@@ -0,0 +1,124 @@
+import asyncio
+import json
+import queue
+import threading
+from collections import deque
+
+
+# subscriber queue living on an asyncio event loop, fed from whichever thread publishes
+class AsyncSubscription:
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.maxsize = maxsize
+        self.queue = asyncio.Queue()
+
+    def put_nowait(self, event):
+        if self.queue.qsize() >= self.maxsize:
+            raise queue.Full
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+
+# in-process fan-out of small change events to every open /events stream. each subscriber gets
+# its own bounded queue, and recent events are kept so a reconnecting browser can catch up
+class EventBroadcaster:
+    def __init__(self, history=256, queue_size=64):
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def publish(self, event_type, data):
+        with self._lock:
+            event = (self._next_id, event_type, json.dumps(data))
+            self._next_id += 1
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # a client that stopped reading is cut off, it reconnects and replays from its last id
+                self.unsubscribe(q)
+                self.dropped += 1
+        return event[0]
+
+    # queue of events, prefilled with whatever was published after last_event_id. with a loop the
+    # queue is an AsyncSubscription for stream_async, so an open stream needs no thread of its own
+    def subscribe(self, last_event_id=None, loop=None):
+        q = AsyncSubscription(loop, self.queue_size) if loop else queue.Queue(self.queue_size)
+        with self._lock:
+            if last_event_id is not None:
+                missed = [e for e in self._history if e[0] > last_event_id][-self.queue_size:]
+                for event in missed:
+                    q.put_nowait(event)
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+        # wakes the stream so it notices it was dropped
+        try:
+            q.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def is_subscribed(self, q):
+        with self._lock:
+            return q in self._subscribers
+
+    # text/event-stream body, with a comment line every keepalive seconds so proxies keep it open
+    def stream(self, q, keepalive=15):
+        yield "retry: 3000\n\n"
+        try:
+            while True:
+                try:
+                    event = q.get(timeout=keepalive)
+                except queue.Empty:
+                    if not self.is_subscribed(q):
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    if not self.is_subscribed(q):
+                        return
+                    continue
+                yield self._format(event)
+        finally:
+            self.unsubscribe(q)
+
+    # the same stream for an asyncio server, q comes from subscribe(loop=...)
+    async def stream_async(self, q, keepalive=15):
+        yield "retry: 3000\n\n"
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(q.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    if not self.is_subscribed(q):
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    if not self.is_subscribed(q):
+                        return
+                    continue
+                yield self._format(event)
+        finally:
+            self.unsubscribe(q)
+
+    @staticmethod
+    def _format(event):
+        event_id, event_type, data = event
+        return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "last_event_id": self._next_id - 1,
+                "dropped": self.dropped
+            }
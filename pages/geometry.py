@@ -0,0 +1,131 @@
+import json
+import math
+
+import numpy as np
+
+# WGS84 ellipsoid, the same one geopy's geodesic distance uses
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+
+
+# [lng, lat] coordinates of each edge geometry, one array per edge
+def edge_coordinates(geoms):
+    coords = []
+    for g in geoms:
+        geom = g["geom"]
+        if isinstance(geom, str):
+            geom = json.loads(geom)
+        coords.append(np.asarray(geom["coordinates"], dtype=np.float64).reshape(-1, 2))
+    return coords
+
+
+# length in meters of every segment between consecutive [lng, lat] points, in one vectorized pass.
+# uses the ellipsoid's meridional and prime vertical radii at each segment's mid-latitude, which
+# for campus-length segments matches the geodesic length to well under a millimeter
+def segment_lengths_meters(starts, ends):
+    lat = np.radians((starts[:, 1] + ends[:, 1]) / 2)
+    w = np.sqrt(1 - WGS84_E2 * np.sin(lat) ** 2)
+    prime_vertical = WGS84_A / w
+    meridional = WGS84_A * (1 - WGS84_E2) / w ** 3
+
+    dx = np.radians(ends[:, 0] - starts[:, 0]) * prime_vertical * np.cos(lat)
+    dy = np.radians(ends[:, 1] - starts[:, 1]) * meridional
+    return np.hypot(dx, dy)
+
+
+# meters covered by one screen pixel on web mercator tiles at this zoom and latitude
+def meters_per_pixel(zoom, lat):
+    return 156543.03392 * math.cos(math.radians(lat)) / 2 ** zoom
+
+
+def _same_point(a, b, tol=1e-6):
+    return abs(a[0] - b[0]) < tol and abs(a[1] - b[1]) < tol
+
+
+# join a route's edge linestrings end to end, like ST_LineMerge, flipping any edge stored backwards
+def merge_line(geoms):
+    lines = [c.tolist() for c in edge_coordinates(geoms) if len(c)]
+    if not lines:
+        return []
+
+    merged = list(lines[0])
+    if len(lines) > 1 and not (_same_point(merged[-1], lines[1][0]) or _same_point(merged[-1], lines[1][-1])):
+        merged.reverse()
+
+    for line in lines[1:]:
+        if _same_point(merged[-1], line[-1]) and not _same_point(merged[-1], line[0]):
+            line = line[::-1]
+        # edges that don't touch are still joined so the route stays one geometry
+        merged.extend(line[1:] if _same_point(merged[-1], line[0]) else line)
+    return merged
+
+
+# douglas-peucker simplification with the tolerance in meters
+def simplify_line(coords, tolerance_m):
+    points = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 3 or tolerance_m <= 0:
+        return points.tolist()
+
+    # project to local meters around the line so distances are isotropic
+    lat0 = math.radians(points[:, 1].mean())
+    xy = np.column_stack([
+        np.radians(points[:, 0]) * WGS84_A * math.cos(lat0),
+        np.radians(points[:, 1]) * WGS84_A
+    ])
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        seg = xy[j] - xy[i]
+        rel = xy[i + 1:j] - xy[i]
+        seg_len2 = seg @ seg
+        t = np.clip(rel @ seg / seg_len2, 0, 1) if seg_len2 else np.zeros(len(rel))
+        offsets = rel - np.outer(t, seg)
+        dist = np.hypot(offsets[:, 0], offsets[:, 1])
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance_m:
+            split = i + 1 + k
+            keep[split] = True
+            stack.append((i, split))
+            stack.append((split, j))
+
+    return points[keep].tolist()
+
+
+# a route's edges as one simplified LineString, dropping detail finer than half a pixel at this zoom
+def merged_route_geometry(geoms, zoom):
+    coords = merge_line(geoms)
+    if coords and zoom:
+        coords = simplify_line(coords, meters_per_pixel(zoom, coords[0][1]) / 2)
+    return {"type": "LineString", "coordinates": coords}
+
+
+# unrounded length of a route in meters
+def route_length_meters(geoms):
+    coords = [c for c in edge_coordinates(geoms) if len(c) > 1]
+    if not coords:
+        return 0.0
+    starts = np.concatenate([c[:-1] for c in coords])
+    ends = np.concatenate([c[1:] for c in coords])
+    return float(segment_lengths_meters(starts, ends).sum())
+
+
+# google encoded polyline of [lng, lat] coordinates; precision 6 keeps positions to about 10 cm
+def encode_polyline(coords, precision=6):
+    points = np.asarray(coords, dtype=np.float64).reshape(-1, 2)[:, ::-1]
+    points = np.round(points * 10 ** precision).astype(np.int64)
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+
+    chunks = []
+    for value in deltas.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
@@ -0,0 +1,123 @@
+# shared log of graph changes, so a closure made in one worker process reaches every other one.
+# each closure, schedule change, reload or alert adds a row in the transaction that made it, and
+# every process applies the rows it has not seen yet in version order. writers take an exclusive
+# lock on the table first, so versions are handed out in commit order and a reader that has seen
+# version n never misses a later commit with a smaller one. sql/graph_changes.sql creates the table,
+# without it changes stay local to the process that made them
+from psycopg2 import errors
+from psycopg2.extras import Json
+
+# rows older than this are deleted, a process that falls further behind reloads everything
+KEEP_DAYS = 1
+# changes to the graph tables themselves rather than to which nodes are open. these rows are never
+# pruned, the newest one versions the graph snapshots
+STRUCTURE_KINDS = ["import", "reload"]
+# /events messages, published by every process to its own streams with the row's delta as data
+EVENT_KINDS = ["alert", "alert-deleted"]
+
+RECORD_QUERY = """
+    INSERT INTO graph_changes (kind, delta)
+    VALUES (%s, %s)
+    RETURNING version
+"""
+
+PRUNE_QUERY = """
+    DELETE FROM graph_changes
+    WHERE created_at < now() - make_interval(days => %s)
+      AND kind <> ALL(%s)
+"""
+
+STRUCTURE_QUERY = """
+    SELECT version, created_at
+    FROM graph_changes
+    WHERE kind = ANY(%s)
+    ORDER BY version DESC
+    LIMIT 1
+"""
+
+SINCE_QUERY = """
+    SELECT version, kind, delta
+    FROM graph_changes
+    WHERE version > %s
+    ORDER BY version
+"""
+
+
+# add a change inside the caller's transaction, committed with it. returns its version, or None
+# when the table is missing
+def record(cur, kind, delta=None):
+    cur.execute("SAVEPOINT graph_change")
+    try:
+        cur.execute("LOCK TABLE graph_changes IN EXCLUSIVE MODE")
+        cur.execute(RECORD_QUERY, (kind, Json(delta) if delta is not None else None))
+        version = cur.fetchone()[0]
+        cur.execute(PRUNE_QUERY, (KEEP_DAYS, STRUCTURE_KINDS))
+    except errors.UndefinedTable:
+        cur.execute("ROLLBACK TO SAVEPOINT graph_change")
+        return None
+    cur.execute("RELEASE SAVEPOINT graph_change")
+    return version
+
+
+# add a change in a transaction of its own
+def record_change(conn, kind, delta=None):
+    cur = conn.cursor()
+    try:
+        version = record(cur, kind, delta)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return version
+
+
+# newest version in the log, 0 when it is empty and None when the table is missing
+def latest_version(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM graph_changes")
+        version = cur.fetchone()[0]
+        conn.commit()
+    except errors.UndefinedTable:
+        conn.rollback()
+        print("graph_changes table missing, run sql/graph_changes.sql to share closures between workers")
+        version = None
+    finally:
+        cur.close()
+    return version
+
+
+# (version, kind, delta) of every change after the given version, oldest first, or None when the
+# table is missing
+def changes_since(conn, version):
+    cur = conn.cursor()
+    try:
+        cur.execute(SINCE_QUERY, (version,))
+        rows = cur.fetchall()
+        conn.commit()
+    except errors.UndefinedTable:
+        conn.rollback()
+        rows = None
+    finally:
+        cur.close()
+    return rows
+
+
+# (version, created_at) of the newest import or reload, None when there is none or the table is
+# missing. runs in a savepoint so a missing table leaves the caller's transaction usable
+def structure_version(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute("SAVEPOINT structure_version")
+        try:
+            cur.execute(STRUCTURE_QUERY, (STRUCTURE_KINDS,))
+            row = cur.fetchone()
+        except errors.UndefinedTable:
+            cur.execute("ROLLBACK TO SAVEPOINT structure_version")
+            return None
+        cur.execute("RELEASE SAVEPOINT structure_version")
+    finally:
+        cur.close()
+    return row
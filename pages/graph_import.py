@@ -0,0 +1,292 @@
+# load an OSMnx GraphML export into the nodes/edges tables the app routes over.
+#   python graph_import.py static/UMBC_StreetMap.graphml             full import
+#   python graph_import.py static/UMBC_StreetMap.graphml --changed   only ways that changed
+# the file is read with iterparse and streamed into temporary tables with COPY, then merged into
+# the graph with a few set-based statements. osm_nodes/osm_edges remember a hash of every imported
+# row, so a re-import only rewrites the ways whose edges changed and drops the ways that are gone.
+# nodes are only added or moved, and nodes and edges the app added by hand (buildings, elevators,
+# ...) are never touched.
+import argparse
+import hashlib
+import xml.etree.ElementTree as ET
+
+import psycopg2
+
+import graph_changes
+from db import DB_SETTINGS
+
+GRAPHML = "{http://graphml.graphdrawing.org/xmlns}"
+
+IMPORT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS osm_nodes (
+        node_id bigint PRIMARY KEY,
+        row_hash text NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS osm_edges (
+        edge_id bigint PRIMARY KEY,
+        way_id text NOT NULL,
+        row_hash text NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS osm_edges_way_id_idx ON osm_edges (way_id);
+"""
+
+STAGING = """
+    CREATE TEMP TABLE import_nodes (
+        id bigint PRIMARY KEY,
+        lng double precision,
+        lat double precision,
+        row_hash text
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE import_edges (
+        id bigint PRIMARY KEY,
+        source bigint,
+        target bigint,
+        cost double precision,
+        wkt text,
+        way_id text,
+        row_hash text
+    ) ON COMMIT DROP;
+"""
+
+# rows whose hash differs from the last import, or every row when %(full)s
+CHANGED = """
+    CREATE TEMP TABLE changed_nodes ON COMMIT DROP AS
+    SELECT s.*
+    FROM import_nodes s
+    LEFT JOIN osm_nodes o ON o.node_id = s.id
+    WHERE %(full)s OR o.row_hash IS DISTINCT FROM s.row_hash;
+
+    -- a way is rewritten as a whole when any of its edges changed
+    CREATE TEMP TABLE changed_edges ON COMMIT DROP AS
+    SELECT s.*
+    FROM import_edges s
+    WHERE s.way_id IN (
+        SELECT s2.way_id
+        FROM import_edges s2
+        LEFT JOIN osm_edges o ON o.edge_id = s2.id
+        WHERE %(full)s OR o.row_hash IS DISTINCT FROM s2.row_hash
+    );
+
+    CREATE TEMP TABLE gone_edges ON COMMIT DROP AS
+    SELECT o.edge_id AS id
+    FROM osm_edges o
+    WHERE NOT EXISTS (SELECT 1 FROM import_edges s WHERE s.id = o.edge_id);
+"""
+
+# merge into graph_nodes/graph_edges (sql/soft_closures.sql) or into nodes/edges, in which case
+# rows currently parked in removed_nodes/removed_edges are updated where they are
+MERGE = """
+    {removed_updates}
+    INSERT INTO {nodes} (id, can_report, geom)
+    SELECT id, FALSE, ST_SetSRID(ST_MakePoint(lng, lat), 4326)
+    FROM changed_nodes
+    {skip_removed_nodes}
+    ON CONFLICT (id) DO UPDATE SET geom = EXCLUDED.geom;
+
+    INSERT INTO {edges} (id, source, target, cost, geom)
+    SELECT id, source, target, cost, ST_GeomFromText(wkt, 4326)
+    FROM changed_edges
+    {skip_removed_edges}
+    ON CONFLICT (id) DO UPDATE
+    SET source = EXCLUDED.source, target = EXCLUDED.target, cost = EXCLUDED.cost, geom = EXCLUDED.geom;
+
+    DELETE FROM {edges} WHERE id IN (SELECT id FROM gone_edges);
+    {removed_deletes}
+"""
+
+REMOVED_UPDATES = """
+    UPDATE removed_nodes r
+    SET geom = ST_SetSRID(ST_MakePoint(c.lng, c.lat), 4326)
+    FROM changed_nodes c
+    WHERE r.id = c.id;
+
+    UPDATE removed_edges r
+    SET source = c.source, target = c.target, cost = c.cost, geom = ST_GeomFromText(c.wkt, 4326)
+    FROM changed_edges c
+    WHERE r.id = c.id;
+"""
+
+BOOKKEEPING = """
+    DELETE FROM osm_edges WHERE edge_id IN (SELECT id FROM gone_edges);
+
+    INSERT INTO osm_nodes (node_id, row_hash)
+    SELECT id, row_hash FROM changed_nodes
+    ON CONFLICT (node_id) DO UPDATE SET row_hash = EXCLUDED.row_hash;
+
+    INSERT INTO osm_edges (edge_id, way_id, row_hash)
+    SELECT id, way_id, row_hash FROM changed_edges
+    ON CONFLICT (edge_id) DO UPDATE SET way_id = EXCLUDED.way_id, row_hash = EXCLUDED.row_hash;
+"""
+
+
+# ("node", osm id, attrs) and ("edge", (source, target, key), attrs) in file order. finished
+# elements are dropped from the tree as soon as they are read, so memory stays flat
+def parse_graphml(path):
+    keys = {}
+    graph = None
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            if elem.tag == GRAPHML + "graph":
+                graph = elem
+            continue
+
+        if elem.tag == GRAPHML + "key":
+            keys[elem.get("id")] = elem.get("attr.name")
+        elif elem.tag in (GRAPHML + "node", GRAPHML + "edge"):
+            attrs = {keys.get(d.get("key")): d.text for d in elem.iter(GRAPHML + "data")}
+            if elem.tag == GRAPHML + "node":
+                yield "node", int(elem.get("id")), attrs
+            else:
+                yield "edge", (int(elem.get("source")), int(elem.get("target")), elem.get("id") or "0"), attrs
+            if graph is not None:
+                graph.remove(elem)
+
+
+# stable positive edge id from an undirected (u, v, key). 52 bits, so the id and the app's
+# -2 * id - 1 virtual edges both stay exact as javascript numbers
+def edge_id(u, v, key):
+    a, b = min(u, v), max(u, v)
+    return int(hashlib.sha1(f"{a}:{b}:{key}".encode("utf-8")).hexdigest()[:13], 16)
+
+
+def row_hash(*values):
+    return hashlib.md5("|".join(str(v) for v in values).encode("utf-8")).hexdigest()
+
+
+# osmnx writes merged ways as "[a, b]", normalised so the order of the ids doesn't matter
+def way_key(osmid):
+    if osmid is None:
+        return ""
+    ids = osmid.strip("[]").replace(" ", "").split(",")
+    return ",".join(sorted(ids))
+
+
+# node rows for COPY, and a generator of edge rows that keeps reading the same parse. osmnx
+# writes every node before the first edge, so node coordinates are known by the time edges stream
+def graph_rows(path):
+    parsed = parse_graphml(path)
+    coords = {}
+    nodes = []
+    first_edge = None
+    for item in parsed:
+        kind, ident, attrs = item
+        if kind == "edge":
+            first_edge = item
+            break
+        lng, lat = float(attrs["x"]), float(attrs["y"])
+        coords[ident] = (lng, lat)
+        nodes.append((ident, lng, lat, row_hash(lng, lat)))
+
+    def remaining():
+        if first_edge is not None:
+            yield first_edge
+            yield from parsed
+
+    return nodes, edge_rows(remaining(), coords)
+
+
+# osmnx stores both directions of a two-way street; the app's graph is undirected, so each
+# (u, v, key) pair is kept once
+def edge_rows(items, coords):
+    seen = set()
+    for kind, ident, attrs in items:
+        if kind != "edge":
+            continue
+        u, v, key = ident
+        canonical = (min(u, v), max(u, v), key)
+        if canonical in seen or u not in coords or v not in coords:
+            continue
+        seen.add(canonical)
+
+        wkt = attrs.get("geometry")
+        if not wkt:
+            wkt = "LINESTRING ({} {}, {} {})".format(*coords[u], *coords[v])
+        cost = float(attrs.get("length") or 0)
+        way = way_key(attrs.get("osmid"))
+        yield edge_id(u, v, key), u, v, cost, wkt, way, row_hash(u, v, cost, wkt)
+
+
+# file-like object that streams rows to COPY as tab separated text without building one big string
+class CopyStream:
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._buffer += "\t".join("\\N" if v is None else str(v) for v in row) + "\n"
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    readline = read
+
+
+def import_graph(conn, path, full=True):
+    nodes, edges = graph_rows(path)
+    cur = conn.cursor()
+    try:
+        cur.execute(IMPORT_SCHEMA)
+        cur.execute(STAGING)
+        cur.copy_expert("COPY import_nodes (id, lng, lat, row_hash) FROM STDIN", CopyStream(nodes))
+        cur.copy_expert(
+            "COPY import_edges (id, source, target, cost, wkt, way_id, row_hash) FROM STDIN",
+            CopyStream(edges)
+        )
+        cur.execute(CHANGED, {"full": full})
+
+        cur.execute("SELECT to_regclass('graph_edges') IS NOT NULL")
+        soft_closures = cur.fetchone()[0]
+        if soft_closures:
+            merge = MERGE.format(
+                nodes="graph_nodes", edges="graph_edges", removed_updates="",
+                skip_removed_nodes="", skip_removed_edges="", removed_deletes=""
+            )
+        else:
+            merge = MERGE.format(
+                nodes="nodes", edges="edges", removed_updates=REMOVED_UPDATES,
+                skip_removed_nodes="WHERE id NOT IN (SELECT id FROM removed_nodes)",
+                skip_removed_edges="WHERE id NOT IN (SELECT id FROM removed_edges)",
+                removed_deletes="DELETE FROM removed_edges WHERE id IN (SELECT id FROM gone_edges);"
+            )
+        cur.execute(merge)
+
+        cur.execute("""
+            SELECT (SELECT COUNT(*) FROM import_edges), (SELECT COUNT(*) FROM changed_nodes),
+                   (SELECT COUNT(*) FROM changed_edges), (SELECT COUNT(*) FROM gone_edges)
+        """)
+        counts = cur.fetchone()
+        cur.execute(BOOKKEEPING)
+        # running app workers reload the graph when they see this, and it versions the snapshots
+        graph_changes.record(cur, "import")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    return {
+        "nodes": len(nodes), "edges": counts[0],
+        "nodes_written": counts[1], "edges_written": counts[2], "edges_deleted": counts[3]
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import an OSMnx GraphML file into nodes/edges")
+    parser.add_argument("path")
+    parser.add_argument("--changed", action="store_true", help="only rewrite ways that changed since the last import")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**DB_SETTINGS)
+    try:
+        result = import_graph(conn, args.path, full=not args.changed)
+    finally:
+        conn.close()
+    print(result)
+    print("Running workers reload the graph on their own once sql/graph_changes.sql is installed,")
+    print("otherwise restart the app or POST /admin/reload-graph to route over the new graph")
@@ -0,0 +1,207 @@
+# versioned on-disk copy of the routing graph's arrays. every array is a plain .npy file opened with
+# np.load(mmap_mode="r"), so a worker starts without querying postgres for the graph or rebuilding
+# the CSR adjacency. the search itself still runs over private python lists that each worker copies
+# from the mapped arrays, and the id lookups and spatial index are built per process too, so this
+# saves load time rather than memory.
+# a snapshot lives in <root>/<checksum>/. the checksum is the newest import or reload in the
+# graph_changes log, or without that log an md5 over every routable row, so a change to the tables
+# gives a new directory. closures are not part of the checksum, the open/closed state is read fresh
+# on every load
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import graph_changes
+
+FORMAT_VERSION = 1
+KEEP_SNAPSHOTS = 3
+
+# everything the graph is built from except the open/closed state, only used without graph_changes
+CHECKSUM_QUERY = """
+    SELECT md5(
+        (SELECT COALESCE(string_agg(concat_ws('|', id, type, building, floor, angle, e_group_id, geom::text), ';' ORDER BY id), '')
+         FROM (
+             SELECT id, type, building, floor, angle, e_group_id, geom FROM nodes
+             UNION ALL
+             SELECT id, type, building, floor, angle, e_group_id, geom FROM removed_nodes
+         ) n)
+        || '#' ||
+        (SELECT COALESCE(string_agg(concat_ws('|', id, source, target, cost, geom::text), ';' ORDER BY id), '')
+         FROM (
+             SELECT id, source, target, cost, geom FROM edges
+             UNION ALL
+             SELECT id, source, target, cost, geom FROM removed_edges
+         ) e)
+    )
+"""
+
+CLOSED_QUERY = """
+    SELECT 'node', id FROM removed_nodes
+    UNION ALL
+    SELECT 'edge', id FROM removed_edges
+"""
+
+# graph attributes stored as-is
+ARRAYS = (
+    "node_ids", "node_coords", "edge_ids", "edge_sources", "edge_targets", "edge_costs",
+    "offsets", "arc_heads", "arc_edges", "arc_costs"
+)
+# per-node attributes stored as int32 codes into a table of distinct values kept in the manifest
+CODED = ("node_types", "node_buildings", "node_floors", "node_angles", "node_groups")
+
+
+# node attribute column read through its codes, behaves like the list it was built from
+class CodedColumn:
+    def __init__(self, codes, values):
+        self.codes = codes
+        self.values = values
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def __iter__(self):
+        values = self.values
+        return (values[c] for c in self.codes.tolist())
+
+
+# edge geojson strings stored back to back in one byte array
+class StringColumn:
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+
+# graph_import.py and /admin/reload-graph log every change to the tables, so the newest of those
+# entries names the graph without reading it. tables changed by hand need a reload to be picked up
+def graph_checksum(conn):
+    latest = graph_changes.structure_version(conn)
+    if latest is not None:
+        version, created_at = latest
+        # the timestamp keeps a recreated log from reusing the directory of an old version
+        return f"v{FORMAT_VERSION}-r{version}-{int(created_at.timestamp())}"
+
+    cur = conn.cursor()
+    try:
+        cur.execute(CHECKSUM_QUERY)
+        digest = cur.fetchone()[0]
+    finally:
+        cur.close()
+    return f"v{FORMAT_VERSION}-{digest}"
+
+
+# ids of the closed nodes and edges, as two sets
+def closed_ids(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute(CLOSED_QUERY)
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+    return {r[1] for r in rows if r[0] == "node"}, {r[1] for r in rows if r[0] == "edge"}
+
+
+def _encode(values):
+    table = {}
+    codes = np.array([table.setdefault(v, len(table)) for v in values], dtype=np.int32)
+    return codes, list(table)
+
+
+def _json_value(value):
+    # numeric columns come back from psycopg2 as Decimal
+    return float(value)
+
+
+# write the graph's arrays under root/<checksum>. the files go to a temporary directory that is
+# renamed into place once complete, so a reader never sees half a snapshot
+def save_snapshot(root, checksum, graph):
+    os.makedirs(root, exist_ok=True)
+    target = os.path.join(root, checksum)
+    if os.path.isdir(target):
+        return target
+
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=root)
+    try:
+        for name in ARRAYS:
+            np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(getattr(graph, name)))
+
+        tables = {}
+        for name in CODED:
+            codes, tables[name] = _encode(getattr(graph, name))
+            np.save(os.path.join(tmp, name + ".npy"), codes)
+
+        encoded = [g.encode("utf-8") if g else b"" for g in graph.edge_geoms]
+        geom_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(g) for g in encoded], out=geom_offsets[1:])
+        np.save(os.path.join(tmp, "edge_geom_offsets.npy"), geom_offsets)
+        np.save(os.path.join(tmp, "edge_geoms.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+        manifest = {
+            "format": FORMAT_VERSION,
+            "checksum": checksum,
+            "nodes": len(graph.node_ids),
+            "edges": len(graph.edge_ids),
+            "tables": tables
+        }
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump(manifest, f, default=_json_value)
+
+        os.rename(tmp, target)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        # another worker finished the same snapshot first
+        if not os.path.isdir(target):
+            raise
+    _prune(root, keep=target)
+    return target
+
+
+# drop all but the most recent snapshots, never the one just written
+def _prune(root, keep):
+    snapshots = [
+        os.path.join(root, name) for name in os.listdir(root)
+        if name.startswith("v") and os.path.isdir(os.path.join(root, name))
+    ]
+    snapshots.sort(key=os.path.getmtime, reverse=True)
+    for path in snapshots[KEEP_SNAPSHOTS:]:
+        if path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# the graph attributes of the snapshot for this checksum, memory-mapped, or None when there is
+# no usable snapshot
+def load_snapshot(root, checksum):
+    path = os.path.join(root, checksum)
+    if not os.path.isdir(path):
+        return None
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest.get("format") != FORMAT_VERSION or manifest.get("checksum") != checksum:
+            return None
+
+        def mapped(name):
+            return np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+
+        attrs = {name: mapped(name) for name in ARRAYS}
+        for name in CODED:
+            attrs[name] = CodedColumn(mapped(name), manifest["tables"][name])
+        attrs["edge_geoms"] = StringColumn(mapped("edge_geoms"), mapped("edge_geom_offsets"))
+    except (OSError, ValueError, KeyError) as e:
+        print("Graph snapshot error:", e)
+        return None
+
+    if len(attrs["node_ids"]) != manifest["nodes"] or len(attrs["edge_ids"]) != manifest["edges"]:
+        return None
+    return attrs
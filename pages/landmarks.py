@@ -0,0 +1,65 @@
+# ALT (A*, landmarks, triangle inequality) lower bounds for the in-process router. for a landmark L
+# on an undirected graph, |d(L, t) - d(L, v)| never overestimates d(v, t), so the largest of these
+# over a few landmarks is an A* potential that lets a search settle far fewer nodes than dijkstra.
+# closing nodes or edges only makes distances longer, so tables computed on a graph with more
+# edges open stay valid lower bounds for the graph with fewer
+import numpy as np
+
+# potentials kept per landmark table, keyed by target set
+POTENTIAL_CACHE_SIZE = 256
+
+
+class Landmarks:
+    def __init__(self, nodes, distances):
+        # distances[i] holds the distance from landmark nodes[i] to every node, inf where unreachable
+        self.nodes = list(nodes)
+        self.distances = distances
+        self._potentials = {}
+
+    # pick landmarks by farthest-point selection: each new landmark is the node whose distance to
+    # the closest landmark chosen so far is largest. distances_from(i) returns a distance array and
+    # candidates masks the nodes that may be picked
+    @classmethod
+    def select(cls, distances_from, candidates, count):
+        candidates = np.flatnonzero(candidates)
+        if not len(candidates) or count <= 0:
+            return None
+
+        # the node farthest from an arbitrary start is the first landmark
+        start = distances_from(int(candidates[0]))
+        closest = np.where(np.isfinite(start), start, -1.0)
+        nodes = []
+        rows = []
+        while len(nodes) < count:
+            pick = int(candidates[np.argmax(closest[candidates])])
+            if pick in nodes:
+                break
+            nodes.append(pick)
+            rows.append(distances_from(pick))
+            closest = np.minimum(closest, np.where(np.isfinite(rows[-1]), rows[-1], -1.0))
+            closest[pick] = -1.0
+        return cls(nodes, np.vstack(rows))
+
+    # the same landmarks with their distances measured again, e.g. over only the open graph
+    def recompute(self, distances_from):
+        return Landmarks(self.nodes, np.vstack([distances_from(i) for i in self.nodes]))
+
+    # lower bound on the distance from every node to the closest of the targets, as a list.
+    # inf marks nodes that cannot reach any target
+    def potential(self, targets):
+        key = frozenset(targets)
+        cached = self._potentials.get(key)
+        if cached is not None:
+            return cached
+
+        to_targets = self.distances[:, sorted(key)]
+        with np.errstate(invalid="ignore"):
+            bounds = np.abs(to_targets[:, :, None] - self.distances[:, None, :])
+        # a landmark that reaches neither the node nor the target says nothing about them
+        bounds[np.isnan(bounds)] = 0.0
+        potential = bounds.max(axis=0).min(axis=0).tolist()
+
+        if len(self._potentials) >= POTENTIAL_CACHE_SIZE:
+            self._potentials.clear()
+        self._potentials[key] = potential
+        return potential
@@ -0,0 +1,81 @@
+import json
+import math
+
+import numpy as np
+
+import geometry
+
+
+# (west, south, east, north) in degrees of a web mercator tile, the same z/x/y scheme as the basemap
+def tile_bounds(z, x, y):
+    n = 2 ** z
+    west = x / n * 360 - 180
+    east = (x + 1) / n * 360 - 180
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+# point and linestring features cut into per-tile GeoJSON. a point belongs to exactly one tile,
+# a line to every tile its bounding box touches. lines are simplified to half a pixel at the
+# tile's zoom, and tiles outside min_zoom..max_zoom are empty
+class TileLayer:
+    def __init__(self, features, min_zoom=0, max_zoom=22, simplify=False):
+        self.features = features
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.simplify = simplify
+        self._coords = [
+            np.asarray(f["geometry"]["coordinates"], dtype=np.float64).reshape(-1, 2) for f in features
+        ]
+        self.boxes = np.array(
+            [(*c.min(axis=0), *c.max(axis=0)) for c in self._coords], dtype=np.float64
+        ).reshape(-1, 4)
+
+    def tile(self, z, x, y):
+        if z < self.min_zoom or z > self.max_zoom or not len(self.features):
+            return {"type": "FeatureCollection", "features": []}
+
+        west, south, east, north = tile_bounds(z, x, y)
+        boxes = self.boxes
+        # half-open on the east and north edges so a point on a tile border is only in one tile
+        hits = np.flatnonzero(
+            (boxes[:, 0] < east) & (boxes[:, 2] >= west) & (boxes[:, 1] < north) & (boxes[:, 3] >= south)
+        )
+        return {"type": "FeatureCollection", "features": [self._feature(i, z) for i in hits.tolist()]}
+
+    def _feature(self, i, z):
+        feature = self.features[i]
+        if not self.simplify or feature["geometry"]["type"] != "LineString":
+            return feature
+        coords = self._coords[i]
+        tolerance = geometry.meters_per_pixel(z, float(coords[0][1])) / 2
+        return {
+            "type": "Feature",
+            "properties": feature["properties"],
+            "geometry": {"type": "LineString", "coordinates": geometry.simplify_line(coords, tolerance)}
+        }
+
+
+def point_feature(lng, lat, properties):
+    return {"type": "Feature", "properties": properties, "geometry": {"type": "Point", "coordinates": [lng, lat]}}
+
+
+# every edge of the routing graph, flagged open when it and both its ends are routable
+def network_features(graph):
+    is_open = (graph.edge_open & graph.node_open[graph.edge_sources] & graph.node_open[graph.edge_targets]).tolist()
+    features = []
+    for e, edge_id in enumerate(graph.edge_ids.tolist()):
+        geom = graph.edge_geoms[e]
+        if not geom:
+            continue
+        features.append({
+            "type": "Feature",
+            "properties": {"id": edge_id, "open": is_open[e]},
+            "geometry": json.loads(geom) if isinstance(geom, str) else geom
+        })
+    return features
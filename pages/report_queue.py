@@ -0,0 +1,130 @@
+import threading
+import time
+
+
+# in-process buffer between /submit-report and the reports table: repeat reports from the same
+# user about the same node are dropped within a window, the rest are written in batches by one
+# background thread, and once max_pending reports are waiting new ones are turned away
+class ReportQueue:
+    def __init__(self, write_batch, max_pending=1000, batch_size=200, flush_interval=1.0,
+                 dedupe_window=600, max_attempts=3):
+        self.write_batch = write_batch
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dedupe_window = dedupe_window
+        self.max_attempts = max_attempts
+
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+
+        self._pending = []
+        self._attempts = 0
+        self._recent = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    # "queued", "duplicate" or "full"; key identifies who reported what, row is the reports insert
+    def submit(self, key, row):
+        now = time.monotonic()
+        with self._lock:
+            seen = self._recent.get(key)
+            if seen is not None and now - seen < self.dedupe_window:
+                self.duplicates += 1
+                return "duplicate"
+            if len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                return "full"
+
+            self._recent[key] = now
+            self._pending.append(row)
+            self.accepted += 1
+            if len(self._recent) > 4 * self.max_pending:
+                self._prune(now)
+            if len(self._pending) >= self.batch_size:
+                self._wake.notify()
+            self._start()
+        return "queued"
+
+    # caller holds the lock
+    def _prune(self, now):
+        self._recent = {k: t for k, t in self._recent.items() if now - t < self.dedupe_window}
+
+    # caller holds the lock
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if len(self._pending) < self.batch_size:
+                    self._wake.wait(self.flush_interval)
+            self.flush()
+
+    # write everything waiting now, one batch at a time
+    def flush(self):
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        while True:
+            with self._lock:
+                batch = self._pending[:self.batch_size]
+            if not batch:
+                return
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                with self._lock:
+                    self._attempts += 1
+                    if self._attempts < self.max_attempts:
+                        print("Report batch failed, retrying:", e)
+                        return
+                    attempts = self._attempts
+                # last attempt: write the rows one at a time so a bad row only loses itself
+                print("Report batch failed", attempts, "times, writing its rows one by one:", e)
+                written = self._write_each(batch)
+                with self._lock:
+                    del self._pending[:len(batch)]
+                    self._attempts = 0
+                    self.written += written
+                    self.failed += len(batch) - written
+                continue
+
+            with self._lock:
+                del self._pending[:len(batch)]
+                self._attempts = 0
+                self.written += len(batch)
+                self.batches += 1
+
+    # rows of a batch that failed as a whole, each in its own insert. returns how many were written
+    def _write_each(self, batch):
+        written = 0
+        for row in batch:
+            try:
+                self.write_batch([row])
+                written += 1
+            except Exception as e:
+                print("Report dropped:", e)
+        return written
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "max_pending": self.max_pending,
+                "accepted": self.accepted,
+                "duplicates": self.duplicates,
+                "rejected": self.rejected,
+                "written": self.written,
+                "batches": self.batches,
+                "failed": self.failed
+            }
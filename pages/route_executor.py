@@ -0,0 +1,73 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# bounded pool for route computations. concurrent requests with the same key share one in-flight
+# computation instead of each running it, and the time a job waits for a worker is recorded
+class RouteExecutor:
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="route")
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_queue_time = 0.0
+        self.max_queue_time = 0.0
+        self.total_run_time = 0.0
+
+    # future for fn(*args), reusing the one already running for this key
+    def submit(self, key, fn, *args):
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            self.submitted += 1
+            future = self._pool.submit(self._timed, fn, args, time.perf_counter())
+            self._in_flight[key] = future
+        future.add_done_callback(lambda f: self._finished(key, f))
+        return future
+
+    # submit and wait, raises concurrent.futures.TimeoutError after timeout seconds
+    def run(self, key, fn, *args, timeout=None):
+        return self.submit(key, fn, *args).result(timeout)
+
+    def _timed(self, fn, args, queued_at):
+        started = time.perf_counter()
+        waited = started - queued_at
+        with self._lock:
+            self.total_queue_time += waited
+            self.max_queue_time = max(self.max_queue_time, waited)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.total_run_time += time.perf_counter() - started
+
+    def _finished(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+            if future.exception() is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def stats(self):
+        with self._lock:
+            done = self.completed + self.failed
+            return {
+                "max_workers": self.max_workers,
+                "in_flight": len(self._in_flight),
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_queue_ms": round(self.total_queue_time / done * 1000, 3) if done else 0,
+                "max_queue_ms": round(self.max_queue_time * 1000, 3),
+                "avg_run_ms": round(self.total_run_time / done * 1000, 3) if done else 0
+            }
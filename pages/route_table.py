@@ -0,0 +1,183 @@
+import json
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# lock files held by this process, by table path. kept per process rather than per table so the
+# table rebuilt after a graph reload keeps the lock its predecessor took
+_owner_files = {}
+_owner_lock = threading.Lock()
+
+
+# every worker keeps the same table in step through graph_changes, so only the process holding the
+# lock file writes it. the lock goes with the process, so another worker takes over if it exits
+def owns_file(path):
+    if fcntl is None:
+        return True
+    with _owner_lock:
+        f = _owner_files.get(path)
+        if f is None:
+            f = _owner_files[path] = open(path + ".lock", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+
+# node ids used by any route in a route set
+def route_set_nodes(route_set):
+    return {node["id"] for nodes in route_set["directions"].values() for node in nodes}
+
+
+# precomputed route sets for every building pair, refreshed pair by pair when the graph changes
+class RouteTable:
+    def __init__(self, build_route_set, graph_version, path=None):
+        self.build_route_set = build_route_set
+        self.graph_version = graph_version
+        self.path = path
+        self.fingerprint = None
+        self.ready = False
+        self._pairs = {}
+        self._pairs_by_node = {}
+        # pairs that were rerouted away from a closed node, recomputed again when it is restored
+        self._displaced = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    def get(self, start, end):
+        with self._lock:
+            return self._pairs.get((start, end))
+
+    def _store(self, pair, route_set):
+        with self._lock:
+            self._drop(pair)
+            if route_set is None:
+                return
+            self._pairs[pair] = route_set
+            for node_id in route_set_nodes(route_set):
+                self._pairs_by_node.setdefault(node_id, set()).add(pair)
+
+    # caller holds the lock
+    def _drop(self, pair):
+        route_set = self._pairs.pop(pair, None)
+        if route_set is None:
+            return
+        for node_id in route_set_nodes(route_set):
+            pairs = self._pairs_by_node.get(node_id)
+            if pairs:
+                pairs.discard(pair)
+
+    def _compute(self, pairs):
+        for start, end in pairs:
+            version = self.graph_version()
+            try:
+                route_set = self.build_route_set(start, end)
+            except Exception as e:
+                print("Route table error for", start, "->", end, ":", e)
+                continue
+            # the graph changed mid-computation, leave the pair to be computed on demand
+            if self.graph_version() == version:
+                self._store((start, end), route_set)
+
+    # full build over every ordered building pair
+    def build(self, buildings, fingerprint):
+        self._compute([(s, e) for s in buildings for e in buildings if s != e])
+        self.fingerprint = fingerprint
+        self.ready = True
+        self.save()
+
+    # drop the pairs whose routes pass through the closed nodes and recompute them
+    def nodes_removed(self, node_ids, fingerprint):
+        with self._lock:
+            affected = set()
+            for node_id in node_ids:
+                affected |= self._pairs_by_node.get(node_id, set())
+            for pair in affected:
+                self._drop(pair)
+            for node_id in node_ids:
+                self._displaced.setdefault(node_id, set()).update(affected)
+        return self._refresh_async(affected, fingerprint)
+
+    # recompute the pairs that avoided the restored nodes, plus pairs to or from their building
+    def nodes_restored(self, node_ids, buildings, fingerprint):
+        with self._lock:
+            affected = set()
+            for node_id in node_ids:
+                affected |= self._displaced.pop(node_id, set())
+            affected |= {pair for pair in self._pairs if pair[0] in buildings or pair[1] in buildings}
+            for pair in affected:
+                self._drop(pair)
+        return self._refresh_async(affected, fingerprint)
+
+    def _refresh_async(self, pairs, fingerprint):
+        def refresh():
+            self._compute(sorted(pairs))
+            self.fingerprint = fingerprint
+            self.save()
+
+        thread = threading.Thread(target=refresh, daemon=True)
+        thread.start()
+        return thread
+
+    def save(self):
+        if not self.path:
+            return
+        with self._save_lock:
+            try:
+                if not owns_file(self.path):
+                    return
+            except OSError as e:
+                print("Route table save error:", e)
+                return
+        with self._lock:
+            data = {
+                "fingerprint": self.fingerprint,
+                "pairs": [
+                    {"start": start, "end": end, "route_set": route_set}
+                    for (start, end), route_set in self._pairs.items()
+                ]
+            }
+        with self._save_lock:
+            # a temporary file of its own, renamed over the table once complete
+            fd, tmp_path = tempfile.mkstemp(prefix=".route_table-", dir=os.path.dirname(self.path) or ".")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print("Route table save error:", e)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    # load a saved table, only if it was built against the same graph. a file that can't be read
+    # counts as no file, and the table is built from scratch
+    def load(self, fingerprint):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("fingerprint") != fingerprint:
+                return False
+
+            pairs = []
+            for item in data["pairs"]:
+                route_set = item["route_set"]
+                # json turns the integer pgr_path_id keys into strings
+                route_set["directions"] = {int(k): v for k, v in route_set["directions"].items()}
+                pairs.append(((item["start"], item["end"]), route_set))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            print("Route table load error:", e)
+            return False
+
+        for pair, route_set in pairs:
+            self._store(pair, route_set)
+        self.fingerprint = fingerprint
+        self.ready = True
+        return True
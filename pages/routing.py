@@ -0,0 +1,623 @@
+import heapq
+import threading
+import time
+
+import numpy as np
+
+import graph_snapshot
+from landmarks import Landmarks
+from spatial import GridIndex
+
+
+# routes can start or end at a single node instead of a building, named "node:<id>"
+NODE_PREFIX = "node:"
+
+
+# in-memory copy of the routable nodes/edges tables, stored as CSR adjacency arrays
+class RoutingGraph:
+    def __init__(self, node_rows, edge_rows):
+        # node rows: id, type, building, floor, angle, lng, lat and optionally whether the node is
+        # open and its e_group_id
+        self.node_ids = np.array([r[0] for r in node_rows], dtype=np.int64)
+        self.node_types = [r[1] for r in node_rows]
+        self.node_buildings = [r[2] for r in node_rows]
+        self.node_floors = [r[3] for r in node_rows]
+        self.node_angles = [r[4] for r in node_rows]
+        self.node_coords = np.array([(r[5], r[6]) for r in node_rows], dtype=np.float64).reshape(-1, 2)
+        self.node_open = np.array([r[7] if len(r) > 7 else True for r in node_rows], dtype=bool)
+        self.node_groups = [r[8] if len(r) > 8 else None for r in node_rows]
+        self.index = {node_id: i for i, node_id in enumerate(self.node_ids.tolist())}
+
+        # edge rows: id, source, target, cost, geojson and optionally whether the edge is open
+        # pgrouting treats a negative cost as a missing edge, so do the same here
+        edge_rows = [
+            r for r in edge_rows
+            if r[1] in self.index and r[2] in self.index and r[3] is not None and r[3] >= 0
+        ]
+        self.edge_ids = np.array([r[0] for r in edge_rows], dtype=np.int64)
+        self.edge_sources = np.array([self.index[r[1]] for r in edge_rows], dtype=np.int32)
+        self.edge_targets = np.array([self.index[r[2]] for r in edge_rows], dtype=np.int32)
+        self.edge_costs = np.array([r[3] for r in edge_rows], dtype=np.float64)
+        self.edge_geoms = [r[4] for r in edge_rows]
+        self.edge_open = np.array([r[5] if len(r) > 5 else True for r in edge_rows], dtype=bool)
+        self.edge_index = {edge_id: i for i, edge_id in enumerate(self.edge_ids.tolist())}
+
+        self._build_csr()
+        self._build_lookups()
+
+    # graph over the memory-mapped arrays of a graph_snapshot.py snapshot, with every node and edge
+    # open except the closed ids given
+    @classmethod
+    def from_snapshot(cls, attrs, closed_nodes=(), closed_edges=()):
+        graph = cls.__new__(cls)
+        graph.__dict__.update(attrs)
+        graph.index = {node_id: i for i, node_id in enumerate(graph.node_ids.tolist())}
+        graph.edge_index = {edge_id: i for i, edge_id in enumerate(graph.edge_ids.tolist())}
+
+        # the open flags change with closures, so they are private writable arrays
+        graph.node_open = np.ones(len(graph.node_ids), dtype=bool)
+        graph.edge_open = np.ones(len(graph.edge_ids), dtype=bool)
+        graph.node_open[[graph.index[n] for n in closed_nodes if n in graph.index]] = False
+        graph.edge_open[[graph.edge_index[e] for e in closed_edges if e in graph.edge_index]] = False
+
+        graph._build_lookups()
+        return graph
+
+    # per-process state derived from the arrays. for a snapshot graph this copies the mapped CSR
+    # arrays into lists, memoryviews over the mapped pages avoid the copy but make queries ~25% slower
+    def _build_lookups(self):
+        # plain lists are much faster than numpy scalars inside the python search loop
+        self._offsets = self.offsets.tolist()
+        self._arc_heads = self.arc_heads.tolist()
+        self._arc_edges = self.arc_edges.tolist()
+        self._arc_costs = self.arc_costs.tolist()
+        self._edge_costs = self.edge_costs.tolist()
+        self._node_open = self.node_open.tolist()
+        self._edge_open = self.edge_open.tolist()
+
+        self._build_building_index()
+        self.spatial = GridIndex(self.node_coords)
+        self._has_edges = np.diff(self.offsets) > 0
+        self._type_masks = {}
+        # A* potentials for shortest_path, see build_landmarks
+        self.landmarks = None
+        self._base_landmarks = None
+        self._reopened = 0
+
+    # every undirected edge becomes two arcs, grouped by their tail node
+    def _build_csr(self):
+        n = len(self.node_ids)
+        m = len(self.edge_ids)
+
+        tails = np.concatenate([self.edge_sources, self.edge_targets])
+        heads = np.concatenate([self.edge_targets, self.edge_sources])
+        arc_edges = np.concatenate([np.arange(m), np.arange(m)]).astype(np.int32)
+
+        order = np.argsort(tails, kind="stable")
+        self.offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tails, minlength=n), out=self.offsets[1:])
+        self.arc_heads = heads[order].astype(np.int32)
+        self.arc_edges = arc_edges[order]
+        self.arc_costs = self.edge_costs[self.arc_edges]
+
+    def _build_building_index(self):
+        self.building_nodes = {}
+        for i, (building, node_type) in enumerate(zip(self.node_buildings, self.node_types)):
+            self.building_nodes.setdefault(building, {}).setdefault(node_type, []).append(i)
+
+    # same fallback as the source_nodes/target_nodes CTEs: elevators, then classrooms, then entrances
+    def endpoint_nodes(self, building, blocked=()):
+        by_type = self.building_nodes.get(building, {})
+        for node_type in ("elevator", "classroom", "entrance"):
+            nodes = [i for i in by_type.get(node_type, []) if self._node_open[i] and i not in blocked]
+            if nodes:
+                return nodes
+        return []
+
+    # open or close nodes and edges from a closures.py delta, False if it names something not loaded
+    def apply_delta(self, delta):
+        updates = []
+        for key, is_open in (("closed_nodes", False), ("opened_nodes", True)):
+            for node in delta.get(key, []):
+                if node["id"] not in self.index:
+                    return False
+                updates.append((self.node_open, self._node_open, self.index[node["id"]], is_open))
+        for key, is_open in (("closed_edges", False), ("opened_edges", True)):
+            for edge in delta.get(key, []):
+                if edge["id"] not in self.edge_index:
+                    return False
+                updates.append((self.edge_open, self._edge_open, self.edge_index[edge["id"]], is_open))
+
+        # bounds measured with these closures in place stop holding once something reopens
+        reopened = any(is_open for *_, is_open in updates)
+        if reopened and self._base_landmarks is not None:
+            self._reopened += 1
+            self.landmarks = self._base_landmarks
+
+        for array, flags, i, is_open in updates:
+            array[i] = is_open
+            flags[i] = is_open
+        if updates and self._base_landmarks is not None:
+            self.customize_landmarks()
+        return True
+
+    # distance from one node to every node as an array, inf where unreachable. node_open and
+    # edge_open restrict the search to open nodes and edges, without them every edge counts
+    def distances_from(self, source, node_open=None, edge_open=None):
+        offsets = self._offsets
+        heads = self._arc_heads
+        arc_edges = self._arc_edges
+        arc_costs = self._arc_costs
+
+        dist = [float("inf")] * (len(offsets) - 1)
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for a in range(offsets[u], offsets[u + 1]):
+                v = heads[a]
+                if edge_open is not None and (not edge_open[arc_edges[a]] or not node_open[v]):
+                    continue
+                nd = d + arc_costs[a]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return np.array(dist)
+
+    # ALT landmark tables measured over every edge, closed or not, so their bounds hold under any
+    # closures. the tables are then customized to the open graph in the background
+    def build_landmarks(self, count):
+        self._base_landmarks = Landmarks.select(self.distances_from, self._has_edges, count)
+        self.landmarks = self._base_landmarks
+        if self._base_landmarks is not None:
+            return self.customize_landmarks()
+        return None
+
+    # re-measure the landmark distances over only the open nodes and edges, which tightens the
+    # bounds while closures last. the landmarks themselves are kept, so this is one dijkstra per
+    # landmark. the result is dropped if anything reopened while it was computed
+    def customize_landmarks(self):
+        base = self._base_landmarks
+        reopened = self._reopened
+        node_open = list(self._node_open)
+        edge_open = list(self._edge_open)
+
+        def customize():
+            custom = base.recompute(lambda i: self.distances_from(i, node_open, edge_open))
+            if self._reopened == reopened and self._base_landmarks is base:
+                self.landmarks = custom
+
+        thread = threading.Thread(target=customize, daemon=True)
+        thread.start()
+        return thread
+
+    def path_cost(self, edges):
+        return sum(self._edge_costs[e] for e in edges)
+
+    # dijkstra seeded from every source at cost 0 (a virtual super-source) that stops at the
+    # first target reached (a virtual super-sink), returns (cost, nodes, edges) or None.
+    # with landmarks built it is A* on their potentials, which settles the same path sooner.
+    # penalties multiplies the cost of some edges (by at least 1, so the potentials stay valid)
+    def shortest_path(self, sources, targets, blocked_nodes=(), blocked_edges=(), penalties=None):
+        targets = set(targets)
+        offsets = self._offsets
+        heads = self._arc_heads
+        arc_edges = self._arc_edges
+        arc_costs = self._arc_costs
+        node_open = self._node_open
+        edge_open = self._edge_open
+        landmarks = self.landmarks
+        potential = landmarks.potential(targets) if landmarks is not None and targets else None
+        inf = float("inf")
+
+        dist = {s: 0.0 for s in sources}
+        prev = {}
+        if potential is None:
+            heap = [(0.0, 0.0, s) for s in dist]
+        else:
+            # a closed start node is still allowed, but tables customized to the open graph can't reach it
+            heap = [(potential[s] if potential[s] < inf else 0.0, 0.0, s) for s in dist]
+            heapq.heapify(heap)
+        settled = set()
+
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+
+            if u in targets:
+                nodes = [u]
+                edges = []
+                while u in prev:
+                    u, e = prev[u]
+                    nodes.append(u)
+                    edges.append(e)
+                nodes.reverse()
+                edges.reverse()
+                return d, nodes, edges
+
+            for a in range(offsets[u], offsets[u + 1]):
+                v = heads[a]
+                e = arc_edges[a]
+                if v in settled or not edge_open[e] or not node_open[v]:
+                    continue
+                if v in blocked_nodes or e in blocked_edges:
+                    continue
+                nd = d + arc_costs[a]
+                if penalties and e in penalties:
+                    nd = d + arc_costs[a] * penalties[e]
+                if nd < dist.get(v, inf):
+                    if potential is None:
+                        key = nd
+                    else:
+                        key = nd + potential[v]
+                        if key == inf:
+                            continue
+                    dist[v] = nd
+                    prev[v] = (u, e)
+                    heapq.heappush(heap, (key, nd, v))
+
+        return None
+
+    # cheapest (source, target) pair over every combination in a single search
+    def best_pair(self, sources, targets, blocked=()):
+        # a start node is never its own destination, so targets that are also sources are left out
+        others = [t for t in targets if t not in set(sources)]
+        if others:
+            found = self.shortest_path(sources, others, blocked)
+        else:
+            # every target is a source too (both ends in the same building): the cheapest pair of
+            # two different nodes, one search per source
+            paths = (
+                self.shortest_path([s], [t for t in targets if t != s], blocked)
+                for s in sources if any(t != s for t in targets)
+            )
+            found = min((p for p in paths if p is not None), key=lambda p: p[0], default=None)
+        if found is None:
+            return None
+        return found[1][0], found[1][-1]
+
+    # yen's k shortest loopless paths, same ordering as pgr_ksp
+    def k_shortest_paths(self, source, target, k, blocked=frozenset()):
+        first = self.shortest_path([source], [target], blocked)
+        if first is None:
+            return []
+
+        paths = [first]
+        candidates = []
+        seen = {tuple(first[2])}
+        counter = 0
+
+        while len(paths) < k:
+            _, last_nodes, last_edges = paths[-1]
+
+            for i in range(len(last_nodes) - 1):
+                spur = last_nodes[i]
+                root_nodes = last_nodes[:i + 1]
+                root_edges = last_edges[:i]
+
+                blocked_edges = set()
+                for _, nodes, edges in paths:
+                    if len(edges) > i and edges[:i] == root_edges and nodes[:i + 1] == root_nodes:
+                        blocked_edges.add(edges[i])
+
+                spur_path = self.shortest_path([spur], [target], blocked | set(root_nodes[:-1]), blocked_edges)
+                if spur_path is None:
+                    continue
+
+                edges = root_edges + spur_path[2]
+                if tuple(edges) in seen:
+                    continue
+                seen.add(tuple(edges))
+
+                nodes = root_nodes[:-1] + spur_path[1]
+                counter += 1
+                heapq.heappush(candidates, (self.path_cost(edges), counter, nodes, edges))
+
+            if not candidates:
+                break
+
+            cost, _, nodes, edges = heapq.heappop(candidates)
+            paths.append((cost, nodes, edges))
+
+        return paths
+
+    # alternatives by the penalty method: after every search the edges of the path it found get
+    # more expensive and the search runs again, until count routes are kept or max_attempts
+    # searches were made. a route is kept when at most max_overlap of its edges are on the
+    # shortest route, like the ksp filter, and it is at most max_stretch times as long.
+    # returns (cost, nodes, edges) in the order found, shortest first
+    def alternative_routes(self, source, target, count=3, max_overlap=0.6, blocked=frozenset(),
+                           penalty=0.5, max_stretch=1.5, max_attempts=None):
+        first = self.shortest_path([source], [target], blocked)
+        if first is None:
+            return []
+
+        routes = [first]
+        shortest_edges = set(first[2])
+        seen = {tuple(first[2])}
+        penalties = {}
+        last_edges = first[2]
+        for _ in range(max_attempts or 4 * count):
+            if len(routes) >= count or not last_edges:
+                break
+            for e in last_edges:
+                penalties[e] = penalties.get(e, 1.0) * (1 + penalty)
+
+            found = self.shortest_path([source], [target], blocked, penalties=penalties)
+            if found is None:
+                break
+            _, nodes, edges = found
+            last_edges = edges
+            if tuple(edges) in seen:
+                continue
+            seen.add(tuple(edges))
+
+            cost = self.path_cost(edges)
+            overlap = sum(1 for e in edges if e in shortest_edges) / len(edges)
+            if overlap <= max_overlap and cost <= first[0] * max_stretch:
+                routes.append((cost, nodes, edges))
+        return routes
+
+    # ranked building-to-building routes, mirrors the overlap filtering in the /map query.
+    # start and end are building names or "node:<id>" places, closed_nodes are node ids left out
+    # of this search only, like scheduled closures. method "ksp" filters k shortest paths,
+    # "penalty" uses alternative_routes
+    def find_routes(self, start, end, k=10, max_overlap=0.6, count=3, closed_nodes=(), method="ksp"):
+        blocked = frozenset(self.index[n] for n in closed_nodes if n in self.index)
+        pair = self.best_pair(self.route_endpoints(start, blocked), self.route_endpoints(end, blocked), blocked)
+        if pair is None:
+            return []
+
+        if method == "penalty":
+            paths = self.alternative_routes(pair[0], pair[1], count, max_overlap, blocked)
+        else:
+            paths = self.k_shortest_paths(pair[0], pair[1], k, blocked)
+        if not paths or not paths[0][2]:
+            return []
+
+        shortest_edges = set(paths[0][2])
+        kept = []
+        for path_id, (cost, nodes, edges) in enumerate(paths, start=1):
+            overlap = sum(1 for e in edges if e in shortest_edges) / len(edges)
+            if path_id == 1 or overlap <= max_overlap:
+                kept.append({"path_id": path_id, "cost": cost, "nodes": nodes, "edges": edges})
+
+        kept.sort(key=lambda p: p["cost"])
+        routes = []
+        for rank, path in enumerate(kept[:count], start=1):
+            path["rank"] = rank
+            routes.append(path)
+        return routes
+
+    # an open arc between two neighbouring nodes, cheapest first, or None
+    def _open_edge_between(self, u, v, blocked=()):
+        best = None
+        for a in range(self._offsets[u], self._offsets[u + 1]):
+            e = self._arc_edges[a]
+            if self._arc_heads[a] == v and self._edge_open[e] and e not in blocked:
+                if best is None or self._arc_costs[a] < self._edge_costs[best]:
+                    best = e
+        return best
+
+    # open node nearest to a position that still has an open edge, optionally only of one type
+    # (elevator, entrance, ...), as (node index, distance in meters) or None. blocked holds node
+    # indices, closed_nodes database node ids, like scheduled closures
+    def nearest_node(self, lng, lat, node_type=None, blocked=(), max_m=None, closed_nodes=()):
+        mask = self.node_open & self._has_edges
+        if node_type is not None:
+            mask &= self._type_mask(node_type)
+        for i in blocked:
+            mask[i] = False
+        for n in closed_nodes:
+            i = self.index.get(n)
+            if i is not None:
+                mask[i] = False
+        return self.spatial.nearest(lng, lat, mask, max_m)
+
+    def _type_mask(self, node_type):
+        if node_type not in self._type_masks:
+            self._type_masks[node_type] = np.array([t == node_type for t in self.node_types], dtype=bool)
+        return self._type_masks[node_type]
+
+    # a building's endpoint nodes, or the one node of a "node:<id>" start snapped from a gps position
+    def route_endpoints(self, place, blocked=()):
+        if place.startswith(NODE_PREFIX):
+            i = self.index.get(int(place[len(NODE_PREFIX):]))
+            return [i] if i is not None and self._node_open[i] and i not in blocked else []
+        return self.endpoint_nodes(place, blocked)
+
+    # check the part of a route still ahead of the user against closures, and route again from the
+    # node nearest to them if it is blocked. node_ids/edge_ids are the route's database ids in order
+    def reroute(self, node_ids, lng, lat, edge_ids=None, closed_nodes=(), max_snap_m=None):
+        if any(n not in self.index for n in node_ids) or len(node_ids) < 2:
+            return {"status": "unknown_route"}
+        if edge_ids is not None and any(e not in self.edge_index for e in edge_ids):
+            return {"status": "unknown_route"}
+
+        blocked = frozenset(self.index[n] for n in closed_nodes if n in self.index)
+        nodes = [self.index[n] for n in node_ids]
+
+        # only what is still ahead matters, so start from the route node closest to the user
+        q = np.array([lng, lat]) * self.spatial.scale
+        ahead = int(np.argmin(np.hypot(*(self.spatial.xy[nodes] - q).T)))
+
+        valid = all(self._node_open[i] and i not in blocked for i in nodes[ahead:])
+        if valid and edge_ids is not None:
+            valid = all(self._edge_open[self.edge_index[e]] for e in edge_ids[ahead:])
+        elif valid:
+            valid = all(
+                self._open_edge_between(u, v) is not None
+                for u, v in zip(nodes[ahead:], nodes[ahead + 1:])
+            )
+        if valid:
+            return {"status": "valid", "position": ahead}
+
+        # keep the destination when it is still open, otherwise any endpoint of its building
+        destination = nodes[-1]
+        if self._node_open[destination] and destination not in blocked:
+            targets = [destination]
+        else:
+            targets = self.endpoint_nodes(self.node_buildings[destination], blocked)
+        start = self.nearest_node(lng, lat, blocked=blocked, max_m=max_snap_m)
+        if start is None or not targets:
+            return {"status": "unreachable"}
+
+        found = self.shortest_path([start[0]], targets, blocked)
+        if found is None:
+            return {"status": "unreachable"}
+        cost, path_nodes, path_edges = found
+        return {
+            "status": "rerouted",
+            "route": {"path_id": 1, "rank": 1, "cost": cost, "nodes": path_nodes, "edges": path_edges}
+        }
+
+    # rows shaped like the /map query: pgr_path_id, seq, route_rank, agg_cost, geom and the
+    # attributes of the node at that step; the final node of each path has no geom
+    def route_rows(self, routes):
+        rows = []
+        for route in routes:
+            agg_cost = 0.0
+            edges = route["edges"]
+            for seq, i in enumerate(route["nodes"], start=1):
+                geom = self.edge_geoms[edges[seq - 1]] if seq <= len(edges) else None
+                rows.append((
+                    route["path_id"], seq, route["rank"], agg_cost, geom,
+                    int(self.node_ids[i]), self.node_types[i], self.node_buildings[i],
+                    self.node_floors[i], self.node_angles[i],
+                    float(self.node_coords[i][0]), float(self.node_coords[i][1])
+                ))
+                if seq <= len(edges):
+                    agg_cost += self._edge_costs[edges[seq - 1]]
+        return rows
+
+
+# read the routable graph out of postgres, closed nodes and edges included so closures can be patched in
+def load_graph(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT id, type, building, floor, angle, ST_X(geom) AS lng, ST_Y(geom) AS lat, TRUE, e_group_id
+            FROM nodes
+            UNION ALL
+            SELECT id, type, building, floor, angle, ST_X(geom) AS lng, ST_Y(geom) AS lat, FALSE, e_group_id
+            FROM removed_nodes
+        """)
+        node_rows = cur.fetchall()
+
+        cur.execute("""
+            SELECT id, source, target, cost, ST_AsGeoJSON(geom) AS geom, TRUE
+            FROM edges
+            UNION ALL
+            SELECT id, source, target, cost, ST_AsGeoJSON(geom) AS geom, FALSE
+            FROM removed_edges
+        """)
+        edge_rows = cur.fetchall()
+    finally:
+        cur.close()
+
+    return RoutingGraph(node_rows, edge_rows)
+
+
+_graph = None
+_graph_version = 0
+_graph_lock = threading.Lock()
+_snapshot_dir = None
+_snapshot_info = {}
+_landmark_count = 0
+
+
+# build this many ALT landmarks whenever the shared graph loads, 0 turns them off
+def set_landmarks(count):
+    global _landmark_count
+    _landmark_count = count
+
+
+# keep graph snapshots under this directory, None or "" turns them off
+def set_snapshot_dir(path):
+    global _snapshot_dir
+    _snapshot_dir = path or None
+
+
+# map the snapshot matching the tables if there is one, otherwise load from postgres and write it.
+# the checksum is taken again after loading so a snapshot is never saved under a checksum the rows
+# changed away from mid-load; with graph_changes installed both are a single indexed lookup
+def load_graph_snapshot(conn, root):
+    started = time.perf_counter()
+    checksum = graph_snapshot.graph_checksum(conn)
+    attrs = graph_snapshot.load_snapshot(root, checksum)
+    if attrs is not None:
+        graph = RoutingGraph.from_snapshot(attrs, *graph_snapshot.closed_ids(conn))
+        source = "snapshot"
+    else:
+        graph = load_graph(conn)
+        source = "postgres"
+        if graph_snapshot.graph_checksum(conn) == checksum:
+            try:
+                graph_snapshot.save_snapshot(root, checksum, graph)
+            except OSError as e:
+                print("Graph snapshot error:", e)
+
+    _snapshot_info.update({
+        "checksum": checksum,
+        "source": source,
+        "load_ms": round((time.perf_counter() - started) * 1000, 3)
+    })
+    return graph
+
+
+# landmarks in use by the shared graph, and whether they are customized to the current closures
+def landmark_info():
+    graph = _graph
+    landmarks = graph.landmarks if graph is not None else None
+    return {
+        "configured": _landmark_count,
+        "active": len(landmarks.nodes) if landmarks is not None else 0,
+        "customized": landmarks is not None and landmarks is not graph._base_landmarks
+    }
+
+
+# where the shared graph was last loaded from and how long it took
+def snapshot_info():
+    return dict(_snapshot_info, enabled=_snapshot_dir is not None)
+
+
+# the shared graph if it is already loaded, None otherwise
+def loaded_graph():
+    return _graph
+
+
+# shared graph, loaded once and reused until the tables change
+def get_graph(conn):
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            _graph = load_graph_snapshot(conn, _snapshot_dir) if _snapshot_dir else load_graph(conn)
+            if _landmark_count:
+                _graph.build_landmarks(_landmark_count)
+        return _graph
+
+
+# bumped every time the routable tables change, used to key cached routes
+def graph_version():
+    return _graph_version
+
+
+# drop the in-memory graph so the next request reloads it
+def invalidate_graph():
+    global _graph, _graph_version
+    with _graph_lock:
+        _graph = None
+        _graph_version += 1
+
+
+# patch the shared graph with a closure delta instead of reloading it
+def apply_graph_delta(delta):
+    global _graph, _graph_version
+    with _graph_lock:
+        if _graph is not None and not _graph.apply_delta(delta):
+            _graph = None
+        _graph_version += 1
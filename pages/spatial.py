@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+
+from geometry import WGS84_A
+
+
+# uniform grid over [lng, lat] points projected to local meters, for nearest-point lookups that
+# only look at the cells around the query instead of every point
+class GridIndex:
+    def __init__(self, coords, cell_m=25.0):
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.cell_m = cell_m
+        lat0 = math.radians(float(self.coords[:, 1].mean())) if len(self.coords) else 0.0
+        self.scale = np.array([math.radians(1) * WGS84_A * math.cos(lat0), math.radians(1) * WGS84_A])
+        self.xy = self.coords * self.scale
+
+        self.cells = {}
+        if len(self.xy):
+            keys = np.floor(self.xy / cell_m).astype(np.int64)
+            self.min_cell = keys.min(axis=0)
+            self.max_cell = keys.max(axis=0)
+            order = np.lexsort((keys[:, 1], keys[:, 0]))
+            sorted_keys = keys[order]
+            splits = np.flatnonzero(np.any(np.diff(sorted_keys, axis=0), axis=1)) + 1
+            for group in np.split(order, splits):
+                k = keys[group[0]]
+                self.cells[(int(k[0]), int(k[1]))] = group
+
+    # (point index, distance in meters) of the closest point allowed by mask, or None.
+    # rings of cells are searched outward until no unsearched cell can hold anything closer
+    def nearest(self, lng, lat, mask=None, max_m=None):
+        if not self.cells:
+            return None
+        q = np.array([lng, lat]) * self.scale
+        cx, cy = (int(v) for v in np.floor(q / self.cell_m))
+        # rings needed to reach every cell from the query's cell
+        last_ring = int(max(
+            abs(cx - self.min_cell[0]), abs(cx - self.max_cell[0]),
+            abs(cy - self.min_cell[1]), abs(cy - self.max_cell[1])
+        ))
+        if max_m is not None:
+            last_ring = min(last_ring, int(max_m // self.cell_m) + 1)
+
+        # far outside the grid (a bad GPS fix), scanning every point is cheaper than walking rings
+        if last_ring > 64:
+            return self._scan(q, mask, max_m)
+
+        best = None
+        best_d = math.inf
+        for r in range(last_ring + 1):
+            # every point in ring r is at least (r - 1) cells away
+            if best is not None and best_d <= (r - 1) * self.cell_m:
+                break
+            candidates = [self.cells.get(key) for key in self._ring(cx, cy, r)]
+            candidates = [c for c in candidates if c is not None]
+            if not candidates:
+                continue
+            idx = np.concatenate(candidates)
+            if mask is not None:
+                idx = idx[mask[idx]]
+                if not len(idx):
+                    continue
+            d = np.hypot(*(self.xy[idx] - q).T)
+            k = int(np.argmin(d))
+            if d[k] < best_d:
+                best, best_d = int(idx[k]), float(d[k])
+
+        if best is None or (max_m is not None and best_d > max_m):
+            return None
+        return best, best_d
+
+    def _scan(self, q, mask, max_m):
+        idx = np.arange(len(self.xy)) if mask is None else np.flatnonzero(mask)
+        if not len(idx):
+            return None
+        d = np.hypot(*(self.xy[idx] - q).T)
+        k = int(np.argmin(d))
+        if max_m is not None and d[k] > max_m:
+            return None
+        return int(idx[k]), float(d[k])
+
+    @staticmethod
+    def _ring(cx, cy, r):
+        if r == 0:
+            return [(cx, cy)]
+        keys = [(cx + dx, cy + dy) for dx in range(-r, r + 1) for dy in (-r, r)]
+        keys += [(cx + dx, cy + dy) for dx in (-r, r) for dy in range(-r + 1, r)]
+        return keys
@@ -0,0 +1,29 @@
+-- Closure indexes
+--
+-- Indexes for the bulk closures in closures.py. Closing or reopening nodes looks them up by id,
+-- e_group_id and building, then finds their edges with one lookup on source and one on target.
+-- Without these, each of those lookups is a sequential scan.
+-- With CLOSURE_MODE=move the lookups hit nodes/edges and removed_nodes/removed_edges. With
+-- CLOSURE_MODE=flag (sql/soft_closures.sql) they hit graph_nodes/graph_edges, whose edge indexes
+-- soft_closures.sql already creates. Safe to run again, and after soft_closures.sql.
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF to_regclass('graph_nodes') IS NULL THEN
+        CREATE INDEX IF NOT EXISTS edges_source_idx ON edges (source);
+        CREATE INDEX IF NOT EXISTS edges_target_idx ON edges (target);
+        CREATE INDEX IF NOT EXISTS removed_edges_source_idx ON removed_edges (source);
+        CREATE INDEX IF NOT EXISTS removed_edges_target_idx ON removed_edges (target);
+        CREATE INDEX IF NOT EXISTS nodes_e_group_id_idx ON nodes (e_group_id);
+        CREATE INDEX IF NOT EXISTS removed_nodes_e_group_id_idx ON removed_nodes (e_group_id);
+        CREATE INDEX IF NOT EXISTS nodes_building_idx ON nodes (building);
+        CREATE INDEX IF NOT EXISTS removed_nodes_building_idx ON removed_nodes (building);
+    ELSE
+        CREATE INDEX IF NOT EXISTS graph_nodes_e_group_id_idx ON graph_nodes (e_group_id);
+        CREATE INDEX IF NOT EXISTS graph_nodes_building_idx ON graph_nodes (building);
+    END IF;
+END $$;
+
+COMMIT;
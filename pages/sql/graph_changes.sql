@@ -0,0 +1,24 @@
+-- Shared graph change log
+--
+-- One row per closure, scheduled closure change, graph reload or alert, added in the transaction
+-- that made the change. Every worker process reads the rows newer than the last one it applied
+-- before answering a request, so routes, caches, map layers and /events streams stay in step
+-- across workers.
+-- Rows older than a day are pruned by the app as it writes new ones, except imports and reloads:
+-- the newest of those versions the graph snapshots (graph_snapshot.py).
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS graph_changes (
+    version bigserial PRIMARY KEY,
+    kind text NOT NULL,
+    delta jsonb,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS graph_changes_created_at_idx ON graph_changes (created_at);
+
+CREATE INDEX IF NOT EXISTS graph_changes_structure_idx ON graph_changes (version)
+    WHERE kind IN ('import', 'reload');
+
+COMMIT;
@@ -0,0 +1,74 @@
+-- Materialized report summary
+--
+-- Per-node report counts bucketed by day, kept up to date by statement-level triggers on reports
+-- so /admin/report-summary sums at most a month of buckets per reported node instead of grouping
+-- every report. Restoring a node deletes its reports, which takes its buckets down with them.
+
+BEGIN;
+
+LOCK TABLE reports IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TABLE IF NOT EXISTS report_counts (
+    node_id bigint NOT NULL,
+    day date NOT NULL,
+    report_count integer NOT NULL,
+    PRIMARY KEY (node_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS report_counts_day_idx ON report_counts (day);
+
+-- paging through one node's reports, newest first
+CREATE INDEX IF NOT EXISTS reports_node_id_id_idx ON reports (node_id, id DESC);
+
+TRUNCATE report_counts;
+INSERT INTO report_counts (node_id, day, report_count)
+SELECT node_id, created_at::date, COUNT(*)
+FROM reports
+WHERE node_id IS NOT NULL
+GROUP BY node_id, created_at::date;
+
+CREATE OR REPLACE FUNCTION report_counts_added() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO report_counts (node_id, day, report_count)
+    SELECT node_id, created_at::date, COUNT(*)
+    FROM added_reports
+    WHERE node_id IS NOT NULL
+    GROUP BY node_id, created_at::date
+    ON CONFLICT (node_id, day) DO UPDATE
+    SET report_count = report_counts.report_count + EXCLUDED.report_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION report_counts_removed() RETURNS trigger AS $$
+BEGIN
+    UPDATE report_counts c
+    SET report_count = c.report_count - d.removed
+    FROM (
+        SELECT node_id, created_at::date AS day, COUNT(*) AS removed
+        FROM removed_reports
+        WHERE node_id IS NOT NULL
+        GROUP BY node_id, created_at::date
+    ) d
+    WHERE c.node_id = d.node_id AND c.day = d.day;
+
+    DELETE FROM report_counts c
+    USING (SELECT DISTINCT node_id FROM removed_reports) d
+    WHERE c.node_id = d.node_id AND c.report_count <= 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS report_counts_insert ON reports;
+CREATE TRIGGER report_counts_insert
+    AFTER INSERT ON reports
+    REFERENCING NEW TABLE AS added_reports
+    FOR EACH STATEMENT EXECUTE FUNCTION report_counts_added();
+
+DROP TRIGGER IF EXISTS report_counts_delete ON reports;
+CREATE TRIGGER report_counts_delete
+    AFTER DELETE ON reports
+    REFERENCING OLD TABLE AS removed_reports
+    FOR EACH STATEMENT EXECUTE FUNCTION report_counts_removed();
+
+COMMIT;
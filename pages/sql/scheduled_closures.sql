@@ -0,0 +1,24 @@
+-- Scheduled closures
+--
+-- Closures known ahead of time (elevator maintenance, construction). Nothing is moved or flagged
+-- when a window opens: the app loads the upcoming windows into an interval index and leaves the
+-- closed nodes out of each route search while their window is active.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS scheduled_closures (
+    id serial PRIMARY KEY,
+    node_id bigint NOT NULL,
+    starts_at timestamptz NOT NULL,
+    ends_at timestamptz NOT NULL,
+    description varchar(255),
+    report_id integer,
+    created_by integer,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    CHECK (ends_at > starts_at)
+);
+
+CREATE INDEX IF NOT EXISTS scheduled_closures_ends_at_idx ON scheduled_closures (ends_at);
+CREATE INDEX IF NOT EXISTS scheduled_closures_node_id_idx ON scheduled_closures (node_id);
+
+COMMIT;
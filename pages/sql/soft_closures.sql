@@ -0,0 +1,59 @@
+-- Soft closures (CLOSURE_MODE=flag)
+--
+-- Keeps every node and edge in graph_nodes/graph_edges with a closed_mask bitmask and turns
+-- nodes, edges, removed_nodes and removed_edges into views over them, so the app's queries keep
+-- working unchanged while closing or restoring a node becomes a single-row UPDATE.
+--
+-- closed_mask bits: 1 = closed by an admin. Scheduled closures never touch the mask, they are
+-- applied per request from scheduled_closures (sql/scheduled_closures.sql).
+-- An edge is routable when its own mask and both of its end nodes' masks are 0.
+
+BEGIN;
+
+ALTER TABLE nodes RENAME TO graph_nodes;
+ALTER TABLE edges RENAME TO graph_edges;
+
+ALTER TABLE graph_nodes ADD COLUMN closed_mask integer NOT NULL DEFAULT 0;
+ALTER TABLE graph_edges ADD COLUMN closed_mask integer NOT NULL DEFAULT 0;
+
+-- fold in whatever the old move-rows closures currently have removed
+INSERT INTO graph_nodes (id, name, building, type, floor, angle, can_report, geom, e_group_id, closed_mask)
+SELECT id, name, building, type, floor, angle, can_report, geom, e_group_id, 1
+FROM removed_nodes;
+
+INSERT INTO graph_edges (id, source, target, cost, geom)
+SELECT id, source, target, cost, geom
+FROM removed_edges;
+
+DROP TABLE removed_nodes;
+DROP TABLE removed_edges;
+
+CREATE INDEX IF NOT EXISTS graph_edges_source_idx ON graph_edges (source);
+CREATE INDEX IF NOT EXISTS graph_edges_target_idx ON graph_edges (target);
+CREATE INDEX IF NOT EXISTS graph_nodes_closed_idx ON graph_nodes (id) WHERE closed_mask <> 0;
+
+CREATE VIEW nodes AS
+    SELECT id, name, building, type, floor, angle, can_report, geom, e_group_id
+    FROM graph_nodes
+    WHERE closed_mask = 0;
+
+CREATE VIEW removed_nodes AS
+    SELECT id, name, building, type, floor, angle, can_report, geom, e_group_id
+    FROM graph_nodes
+    WHERE closed_mask <> 0;
+
+CREATE VIEW edges AS
+    SELECT e.id, e.source, e.target, e.cost, e.geom
+    FROM graph_edges e
+    JOIN graph_nodes s ON s.id = e.source
+    JOIN graph_nodes t ON t.id = e.target
+    WHERE e.closed_mask = 0 AND s.closed_mask = 0 AND t.closed_mask = 0;
+
+CREATE VIEW removed_edges AS
+    SELECT e.id, e.source, e.target, e.cost, e.geom
+    FROM graph_edges e
+    JOIN graph_nodes s ON s.id = e.source
+    JOIN graph_nodes t ON t.id = e.target
+    WHERE e.closed_mask <> 0 OR s.closed_mask <> 0 OR t.closed_mask <> 0;
+
+COMMIT;
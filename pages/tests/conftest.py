@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the app's modules import each other by plain name from pages/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
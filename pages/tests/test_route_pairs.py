@@ -0,0 +1,104 @@
+# both ends in the same building: the start and destination node sets are the same, and the
+# chosen pair must be two different nodes rather than one node paired with itself
+import json
+
+import pytest
+
+import routing
+
+# building A has elevators 1 and 2, joined through walkway 3; building B's elevator 4 hangs off 2
+NODES = [
+    (1, "elevator", "A", "1", None, -76.7140, 39.2550),
+    (2, "elevator", "A", "1", None, -76.7138, 39.2550),
+    (3, "walkway", None, None, None, -76.7139, 39.2551),
+    (4, "elevator", "B", "1", None, -76.7130, 39.2550),
+]
+EDGES = [(10, 1, 3, 1.0), (11, 3, 2, 1.0), (12, 2, 4, 5.0)]
+
+
+def line(source, target):
+    coords = {n[0]: [n[5], n[6]] for n in NODES}
+    return json.dumps({"type": "LineString", "coordinates": [coords[source], coords[target]]})
+
+
+def memory_graph():
+    return routing.RoutingGraph(NODES, [(e, s, t, c, line(s, t)) for e, s, t, c in EDGES])
+
+
+def test_best_pair_same_building_uses_two_nodes():
+    graph = memory_graph()
+    endpoints = graph.endpoint_nodes("A")
+    source, target = graph.best_pair(endpoints, endpoints)
+    assert source != target
+    assert {int(graph.node_ids[source]), int(graph.node_ids[target])} == {1, 2}
+
+
+def test_best_pair_leaves_shared_targets_out():
+    graph = memory_graph()
+    a = graph.index
+    # node 2 is in both sets, so it can only be a start
+    source, target = graph.best_pair([a[1], a[2]], [a[2], a[4]])
+    assert (int(graph.node_ids[source]), int(graph.node_ids[target])) == (2, 4)
+
+
+def test_find_routes_same_building():
+    routes = memory_graph().find_routes("A", "A")
+    assert routes
+    assert routes[0]["cost"] == 2.0
+
+
+def pgrouting_conn():
+    psycopg2 = pytest.importorskip("psycopg2")
+    from db import DB_SETTINGS
+
+    try:
+        conn = psycopg2.connect(connect_timeout=2, **DB_SETTINGS)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"no database: {e}")
+    cur = conn.cursor()
+    cur.execute("SELECT count(*) FROM pg_extension WHERE extname IN ('postgis', 'pgrouting')")
+    if cur.fetchone()[0] < 2:
+        conn.close()
+        pytest.skip("postgis and pgrouting are not installed")
+    cur.close()
+    return conn
+
+
+def test_routes_query_same_building():
+    conn = pgrouting_conn()
+    # importing app opens its connection pool, only do it once a database is known to be there
+    from app import ROUTES_QUERY
+
+    cur = conn.cursor()
+    try:
+        # temporary tables shadow the real ones for this session, pgr_* included
+        cur.execute("""
+            CREATE TEMP TABLE nodes (
+                id bigint PRIMARY KEY, type text, building text, floor text, angle double precision,
+                geom geometry(Point, 4326)
+            );
+            CREATE TEMP TABLE edges (
+                id bigint PRIMARY KEY, source bigint, target bigint, cost double precision,
+                geom geometry(LineString, 4326)
+            );
+        """)
+        for node_id, node_type, building, floor, angle, lng, lat in NODES:
+            cur.execute(
+                "INSERT INTO nodes VALUES (%s, %s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326))",
+                (node_id, node_type, building, floor, angle, lng, lat)
+            )
+        for edge_id, source, target, cost in EDGES:
+            cur.execute(
+                "INSERT INTO edges VALUES (%s, %s, %s, %s, ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326))",
+                (edge_id, source, target, cost, line(source, target))
+            )
+
+        cur.execute(ROUTES_QUERY, ([], "A", "A", "A", "A", "A", "A", "A", "A", "A", "A", 0.6, 3))
+        rows = cur.fetchall()
+    finally:
+        conn.rollback()
+        conn.close()
+
+    assert rows
+    shortest = [r for r in rows if r[2] == 1]
+    assert {shortest[0][5], shortest[-1][5]} == {1, 2}